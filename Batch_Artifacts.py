@@ -0,0 +1,198 @@
+'''
+*********************************** LICENSE ***********************************
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You can view the GNU General Public License at <http://www.gnu.org/licenses/>
+*******************************************************************************
+
+Batch_Artifacts - WARNING: This program is provided "as-is"
+
+Author    : Gabriele Zambelli (Twitter: @gazambelli)
+Blog      : http://forensenellanebbia.blogspot.it
+Version   : 20261018
+
+Script to run Firefox_NoScript, Firefox_AdblockPlus and VLC_LastPlayedPosition over one or more directories
+(e.g. mounted disk images) and merge their results into a single output file (CSV, JSON Lines or columnar, see Output_Writers.py).
+The script walks the directories and parses every file named:
+ - storage-sync.sqlite    (NoScript permissions, from any Firefox profile, not only '.default' ones)
+ - storage.js             (Adblock Plus whitelisted websites)
+ - vlc-qt-interface.ini   (VLC media player - Windows)
+ - vlc-qt-interface.conf  (VLC media player - Linux)
+ - org.videolan.vlc.plist (VLC media player - macOS)
+and every Chrome 'Local Extension Settings/cfhdojbkjhnklbpkdaibdccddilifddb' folder (Adblock Plus for Chrome).
+
+Each row of the output records the browser profile (if any) and the file it comes from.
+NoScript sites are listed without sending any HTTP request (see the -r option of Firefox_NoScript.py).
+
+Requirements:
+ - Python 2.7
+'''
+
+import multiprocessing
+import os
+import sys
+
+import Firefox_AdblockPlus
+import Firefox_NoScript
+import Output_Writers
+import Results_Cache
+import VLC_LastPlayedPosition
+
+#functions
+def get_help():
+    print "\nScript to parse the NoScript, Adblock Plus and VLC media player artifacts found under one or more directories"
+    print "\nOPTIONS:"
+    print "--jobs N: Number of processes used to parse the files (default: number of CPUs)"
+    print "--cache FILE: Keep the results in FILE and only parse the files that are new or modified since the previous run"
+    print "--output FILE: Output file (default: <date>_<time>_batch.csv)"
+    print "--format FORMAT: Output format: csv, jsonl or columnar (default: from the extension of the output file)"
+    print "\nEXAMPLES:"
+    print "python Batch_Artifacts.py E:\\ F:\\"
+    print "python Batch_Artifacts.py /mnt/image1 /mnt/image2 --jobs 8 --cache case123.cache"
+
+def get_artifact(filename):
+    if filename == 'storage-sync.sqlite':
+        return 'NoScript'
+    if filename == 'storage.js':
+        return 'AdblockPlus'
+    if filename in ('vlc-qt-interface.ini', 'vlc-qt-interface.conf', 'org.videolan.vlc.plist'):
+        return 'VLC'
+    return None
+
+def get_profile(path, artifact):
+    #Firefox (or Chrome) profile the file belongs to
+    if artifact == 'NoScript':
+        return os.path.dirname(path)
+    if artifact == 'AdblockPlus' and os.path.isdir(path):
+        return os.path.dirname(os.path.dirname(path))
+    if artifact == 'AdblockPlus':
+        extension_dir = os.path.dirname(os.path.dirname(path))
+        if os.path.basename(extension_dir) == 'browser-extension-data':
+            return os.path.dirname(extension_dir)
+    return ''
+
+def get_files(roots):
+    #returns the sorted list of (artifact, path) found under the root directories
+    files = []
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            if os.path.basename(dirpath) == Firefox_AdblockPlus.chrome_id and os.path.basename(os.path.dirname(dirpath)) == 'Local Extension Settings':
+                files.append(('AdblockPlus', dirpath))
+                continue
+            for filename in filenames:
+                artifact = get_artifact(filename)
+                if artifact is not None:
+                    files.append((artifact, os.path.join(dirpath, filename)))
+    return sorted(files)
+
+def get_rows(task):
+    #Artifact,Profile,Item,Value,Raw value,File
+    artifact, path = task
+    profile = get_profile(path, artifact)
+    rows    = []
+    try:
+        if artifact == 'NoScript':
+            for permission in Firefox_NoScript.get_permissions(path):
+                rows.append([artifact, profile, permission.site, permission.trust_level, '', path])
+        elif artifact == 'AdblockPlus' and os.path.isdir(path):
+            for record in sorted(Firefox_AdblockPlus.get_whitelist_chrome(path)):
+                rows.append([artifact, profile, record.website, 'whitelisted', '', record.file])
+        elif artifact == 'AdblockPlus':
+            for record in sorted(Firefox_AdblockPlus.get_whitelist(path)):
+                rows.append([artifact, profile, record.website, 'whitelisted', '', path])
+        else:
+            for recent in VLC_LastPlayedPosition.get_recents(path):
+                rows.append([artifact, profile, recent.media_file, recent.position if recent.position is not None else 'N/A', recent.raw_value, path])
+        #paths and media files are byte strings: UTF-8, or Latin-1 when they are not valid UTF-8
+        rows = [[Output_Writers.get_value(value) for value in row] for row in rows]
+    except Exception as e:
+        return path, [], '%s: %s' % (type(e).__name__, e)
+    return path, rows, None
+
+def get_results(files, jobs, cache=None):
+    #yields (task, path, rows, error) in the order of files, parsing only the files missing from the cache
+    cached = {} #(artifact, path) -> rows of a previous run
+    keys   = {}
+    if cache is not None:
+        for task in files:
+            try:
+                keys[task] = Results_Cache.get_file_key(*task)
+            except OSError:
+                continue
+            rows = cache.get(keys[task])
+            if rows is not None:
+                cached[task] = rows
+    pool = multiprocessing.Pool(jobs)
+    try:
+        #imap keeps the order of the files, so that the output is the same on every run
+        results = pool.imap(get_rows, [task for task in files if task not in cached], chunksize=16)
+        for task in files:
+            if task in cached:
+                yield task, task[1], cached[task], None
+                continue
+            path, rows, error = next(results)
+            if error is None and task in keys:
+                cache.put(keys[task], rows, Results_Cache.file_ttl)
+            yield task, path, rows, error
+    finally:
+        pool.close()
+        pool.join()
+
+def get_batch(roots, jobs, fn, cache=None, format=None):
+    files = get_files(roots)
+    print "\nFiles found: %d" % len(files)
+    errors = []
+    n_rows = 0
+    with Output_Writers.get_writer(fn, ['Artifact', 'Profile', 'Item', 'Value', 'Raw value', 'File'], format) as writer:
+        for task, path, rows, error in get_results(files, jobs, cache):
+            if error is not None:
+                errors.append((path, error))
+            writer.write_rows(rows)
+            n_rows += len(rows)
+    print "Rows saved: %d" % n_rows
+    if cache is not None:
+        print cache.get_summary()
+    if len(errors) > 0:
+        print "\nThe following files could not be parsed: (%d)" % len(errors)
+        for path, error in errors:
+            print "- %s (%s)" % (path, error)
+    print "\nOutput saved to: %s" % fn
+
+def main(argv):
+    argv, fn, format = Output_Writers.get_output_args(argv, 'batch')
+    roots = []
+    jobs  = multiprocessing.cpu_count()
+    cache = None
+    args  = argv[1:]
+    while len(args) > 0:
+        arg = args.pop(0)
+        if arg == '--jobs' and len(args) > 0 and args[0].isdigit():
+            jobs = max(1, int(args.pop(0)))
+        elif arg == '--cache' and len(args) > 0:
+            cache = args.pop(0)
+        elif os.path.isdir(arg):
+            roots.append(os.path.abspath(arg))
+        else:
+            print "\nThe following directory was not found: %s" % arg
+    if len(roots) > 0:
+        if cache is not None:
+            cache = Results_Cache.ResultsCache(cache)
+        try:
+            get_batch(roots, jobs, fn, cache, format)
+        finally:
+            if cache is not None:
+                cache.close()
+    else:
+        get_help()
+
+#start
+if __name__ == '__main__':
+    main(sys.argv)
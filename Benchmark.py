@@ -0,0 +1,215 @@
+'''
+*********************************** LICENSE ***********************************
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You can view the GNU General Public License at <http://www.gnu.org/licenses/>
+*******************************************************************************
+
+Benchmark - WARNING: This program is provided "as-is"
+
+Author    : Gabriele Zambelli (Twitter: @gazambelli)
+Blog      : http://forensenellanebbia.blogspot.it
+Version   : 20261018
+
+Script to time Firefox_NoScript.get_sites, Firefox_AdblockPlus.get_whitelisted (storage.js and Chrome LevelDB),
+VLC_LastPlayedPosition.get_LPP_WinNix and VLC_LastPlayedPosition.get_LPP_macOS over synthetic artifacts (see Synthetic_Artifacts.py) and to detect regressions.
+ - every run is a separate Python process, so that the peak memory (maximum resident set size) of each function is
+   measured on its own; the fastest of --repeat runs is kept
+ - the number of records found in each file is checked: a parser that misses entries fails the benchmark
+ - with --baseline FILE, a time or peak memory more than --threshold above the baseline fails the benchmark
+   (differences under 0.05 seconds or 5 MB are ignored, they are noise at small sizes)
+The exit code is 1 when the benchmark fails. --save-baseline FILE stores the results to compare the next runs with.
+
+Requirements:
+ - Python 2.7
+ - the peak memory is not available on Windows (no 'resource' module)
+'''
+
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import Synthetic_Artifacts
+
+cases     = ['NoScript', 'AdblockPlus', 'VLC_WinNix', 'VLC_macOS', 'AdblockPlus_Chrome'] # in the order of Synthetic_Artifacts.writers
+sizes     = [10, 1000, 100000]
+threshold = 0.25 # a result 25% above the baseline is a regression
+min_time  = 0.05 # seconds
+min_peak  = 5.0  # MB
+
+#functions
+def get_help():
+    print "\nScript to benchmark the parsers of this repository over synthetic artifacts"
+    print "\nOPTIONS:"
+    print "--entries N[,N...]: Numbers of entries of the synthetic artifacts (default: %s)" % ",".join(str(size) for size in sizes)
+    print "--repeat N: Runs of each function, the fastest one is kept (default: 3)"
+    print "--baseline FILE: Fail if a result is worse than the baseline saved in FILE"
+    print "--threshold PERCENT: Tolerance over the baseline (default: %d)" % (threshold * 100)
+    print "--save-baseline FILE: Save the results to FILE"
+    print "--keep DIR: Write the synthetic artifacts to DIR and keep them"
+    print "\nEXAMPLES:"
+    print "python Benchmark.py --save-baseline baseline.json"
+    print "python Benchmark.py --baseline baseline.json"
+    print "python Benchmark.py --entries 10,1000,100000,1000000 --repeat 1"
+
+def get_peak_memory():
+    #maximum resident set size of this process in MB (kilobytes on Linux, bytes on macOS)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if platform.system() == 'Darwin':
+        return peak / 1024.0 / 1024.0
+    return peak / 1024.0
+
+def get_run(case, path):
+    #runs in a child process: times the function of case over path, then counts the records of the file
+    import Firefox_AdblockPlus
+    import Firefox_NoScript
+    import VLC_LastPlayedPosition
+    fn     = path + ".benchmark.csv"
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        s_time = time.time()
+        if case == 'NoScript':
+            Firefox_NoScript.get_sites(path)
+        elif case in ('AdblockPlus', 'AdblockPlus_Chrome'):
+            Firefox_AdblockPlus.get_whitelisted(path)
+        elif case == 'VLC_WinNix':
+            VLC_LastPlayedPosition.get_LPP_WinNix(path, fn)
+        else:
+            VLC_LastPlayedPosition.get_LPP_macOS(path, fn)
+        elapsed = time.time() - s_time
+        peak    = get_peak_memory()
+        if case == 'NoScript':
+            records = len(list(Firefox_NoScript.get_permissions(path)))
+        elif case == 'AdblockPlus':
+            records = len(list(Firefox_AdblockPlus.get_whitelist(path)))
+        elif case == 'AdblockPlus_Chrome':
+            records = len(list(Firefox_AdblockPlus.get_whitelist_chrome(path)))
+        else:
+            records = len(list(VLC_LastPlayedPosition.get_recents(path)))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        if os.path.isfile(fn):
+            os.remove(fn)
+    print json.dumps({"seconds": elapsed, "peak_mb": peak, "records": records})
+
+def get_result(case, path, repeat):
+    #fastest of repeat runs, each one in a new process
+    results = []
+    for n in range(repeat):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--run", case, path])
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    result = min(results, key=lambda result: result["seconds"])
+    if None not in [item["peak_mb"] for item in results]:
+        result["peak_mb"] = max(item["peak_mb"] for item in results)
+    return result
+
+def get_regressions(key, result, baseline, tolerance):
+    #list of the results worse than the baseline
+    if baseline is None or key not in baseline["results"]:
+        return []
+    base     = baseline["results"][key]
+    problems = []
+    if result["seconds"] > base["seconds"] * (1 + tolerance) and result["seconds"] - base["seconds"] > min_time:
+        problems.append("time %.3f s, baseline %.3f s" % (result["seconds"], base["seconds"]))
+    if result["peak_mb"] is not None and base.get("peak_mb") is not None:
+        if result["peak_mb"] > base["peak_mb"] * (1 + tolerance) and result["peak_mb"] - base["peak_mb"] > min_peak:
+            problems.append("peak memory %.1f MB, baseline %.1f MB" % (result["peak_mb"], base["peak_mb"]))
+    return problems
+
+def get_benchmark(entries, repeat, baseline=None, tolerance=threshold, folder=None):
+    #returns (results by 'case|entries', list of failures)
+    results  = {}
+    failures = []
+    print "\n%-18s %10s %10s %14s %10s  %s" % ("Function", "Entries", "Seconds", "Entries/s", "Peak MB", "Result")
+    for size in entries:
+        size_dir = os.path.join(folder, str(size)) if folder is not None else tempfile.mkdtemp(prefix="Benchmark_")
+        try:
+            artifacts = Synthetic_Artifacts.get_artifacts(size_dir, size)
+            for case, (path, expected) in zip(cases, artifacts):
+                key    = "%s|%d" % (case, size)
+                result = get_result(case, path, repeat)
+                results[key] = result
+                problems = get_regressions(key, result, baseline, tolerance)
+                if result["records"] != expected:
+                    problems.insert(0, "%d records found, %d expected" % (result["records"], expected))
+                if len(problems) > 0:
+                    failures.append((key, problems))
+                peak = "%.1f" % result["peak_mb"] if result["peak_mb"] is not None else "N/A"
+                print "%-18s %10d %10.3f %14.0f %10s  %s" % (case, size, result["seconds"], size / max(result["seconds"], 1e-6),
+                                                                  peak, "FAIL - " + "; ".join(problems) if problems else "OK")
+        finally:
+            if folder is None:
+                shutil.rmtree(size_dir, ignore_errors=True)
+    return results, failures
+
+def main(argv):
+    if len(argv) == 4 and argv[1] == '--run':
+        get_run(argv[2], argv[3])
+        return
+    entries   = sizes
+    repeat    = 3
+    baseline  = None
+    save      = None
+    folder    = None
+    tolerance = threshold
+    args      = argv[1:]
+    while len(args) > 0:
+        arg = args.pop(0)
+        if len(args) == 0:
+            get_help()
+            return
+        value = args.pop(0)
+        if arg == '--entries':
+            entries = [int(size) for size in value.split(',') if size.strip().isdigit()]
+        elif arg == '--repeat' and value.isdigit():
+            repeat = max(1, int(value))
+        elif arg == '--threshold' and value.isdigit():
+            tolerance = int(value) / 100.0
+        elif arg == '--baseline':
+            with open(value, "rb") as f:
+                baseline = json.load(f)
+        elif arg == '--save-baseline':
+            save = value
+        elif arg == '--keep':
+            folder = value
+        else:
+            get_help()
+            return
+    print "\nPython %s - %s" % (platform.python_version(), platform.platform())
+    results, failures = get_benchmark(entries, repeat, baseline, tolerance, folder)
+    if save is not None:
+        with open(save, "wb") as f:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(), "results": results}, f, indent=1, sort_keys=True)
+        print "\nBaseline saved to: %s" % save
+    if len(failures) > 0:
+        print "\nBenchmark FAILED: (%d)" % len(failures)
+        for key, problems in failures:
+            print "- %s: %s" % (key.replace("|", ", "), "; ".join(problems))
+        sys.exit(1)
+    print "\nBenchmark passed"
+
+#start
+if __name__ == '__main__':
+    main(sys.argv)
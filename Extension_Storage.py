@@ -0,0 +1,214 @@
+'''
+*********************************** LICENSE ***********************************
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You can view the GNU General Public License at <http://www.gnu.org/licenses/>
+*******************************************************************************
+
+Extension_Storage - WARNING: This program is provided "as-is"
+
+Author    : Gabriele Zambelli (Twitter: @gazambelli)
+Blog      : http://forensenellanebbia.blogspot.it
+Version   : 20261018
+
+Script to list the data saved by every extension of one or more Firefox profiles, reading each file once:
+ - storage-sync.sqlite                      : all the rows of 'collection_data' are read with a single query and
+                                              grouped by collection ('default/<extension ID>')
+ - browser-extension-data/<ID>/storage.js   : each file is memory-mapped once
+The data of an extension is extracted by the plugin registered for its ID (see register):
+ - NoScript     : non-default permissions (storage-sync.sqlite, see Firefox_NoScript.py)
+ - Adblock Plus : whitelisted websites (storage.js, see Firefox_AdblockPlus.py)
+The extensions without a plugin are listed too: one row per record ID (storage-sync.sqlite) or per top-level key
+(storage.js), so that they can be spotted and a plugin can be added for them.
+
+A plugin is a function that receives the records of a collection ({record ID: record as UTF-8 JSON}) or the
+content of a storage.js file, plus the path of the file, and yields (item, value) pairs, e.g.:
+    def get_example(records, path):
+        for record_id, record in records.items():
+            yield record_id, json.loads(record)['data'].get('enabled', '')
+    register('Example', '{12345678-1234-1234-1234-123456789012}', sync_parser=get_example)
+
+Requirements:
+ - Python 2.7
+'''
+
+from collections import namedtuple
+import getpass
+import json
+import mmap
+import os
+import platform
+import sys
+
+import Firefox_AdblockPlus
+import Firefox_NoScript
+import Metrics
+import Output_Writers
+
+# Plugin: the functions that extract the data of an extension from storage-sync.sqlite and/or storage.js
+# Item  : a row of the output (Extension,ExtensionID,Item,Value,Profile,File)
+Plugin = namedtuple('Plugin', 'name extension_id sync_parser storage_parser')
+Item   = namedtuple('Item', 'extension extension_id item value profile file')
+
+plugins = {} # extension ID -> Plugin
+
+#functions
+def get_help():
+    print "\nScript to list the data saved by the extensions of one or more Firefox profiles (storage-sync.sqlite and browser-extension-data)"
+    print "\nOPTIONS:"
+    print "--default-path: Analyze the Firefox profiles on the current system"
+    print "--wal: Also read the records of the storage-sync.sqlite-wal files (from a temporary copy)"
+    print "--output FILE: Output file (default: <date>_<time>_extensions.csv)"
+    print "--format FORMAT: Output format: csv, jsonl or columnar (default: from the extension of the output file)"
+    print "--metrics FILE: Save the time spent reading each file and the size of the files read to FILE (JSON)"
+    print "\nEXAMPLES:"
+    print "python Extension_Storage.py --default-path"
+    print "python Extension_Storage.py /mnt/image1/Users /mnt/image2/home --output extensions.jsonl"
+
+def register(name, extension_id, sync_parser=None, storage_parser=None):
+    plugins[extension_id] = Plugin(name, extension_id, sync_parser, storage_parser)
+
+def get_noscript(records, path):
+    if 'key-policy' in records:
+        for permission in Firefox_NoScript.get_policy_permissions(records['key-policy'], path):
+            yield permission.site, permission.trust_level
+
+def get_adblockplus(data, path):
+    for website in Firefox_AdblockPlus.get_websites(data):
+        yield website, 'whitelisted'
+
+register('NoScript', Firefox_NoScript.noscript_id, sync_parser=get_noscript)
+register('Adblock Plus', Firefox_AdblockPlus.firefox_id, storage_parser=get_adblockplus)
+
+def get_profiles(roots):
+    #folders holding a storage-sync.sqlite file or a browser-extension-data folder
+    profiles = []
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            if 'storage-sync.sqlite' in filenames or 'browser-extension-data' in dirnames:
+                profiles.append(dirpath)
+    return sorted(profiles)
+
+def get_collections(StorageSyncDB, wal=False):
+    #returns {collection name: {record_id: record}} with one pass over collection_data
+    collections = {}
+    with Metrics.timer("extensions.sqlite"):
+        with Firefox_NoScript.get_sqlite_connection(StorageSyncDB, wal) as connect:
+            for collection_name, record_id, record in connect.execute("SELECT collection_name, record_id, record FROM collection_data"):
+                collections.setdefault(collection_name, {})[record_id] = Firefox_NoScript.get_bytes(record)
+    Metrics.count_file("extensions.file_size", StorageSyncDB)
+    return collections
+
+def get_sync_items(StorageSyncDB, profile, wal=False):
+    for collection_name, records in sorted(get_collections(StorageSyncDB, wal).items()):
+        extension_id = collection_name.split('/', 1)[-1]
+        plugin       = plugins.get(extension_id)
+        if plugin is None or plugin.sync_parser is None:
+            for record_id in sorted(records):
+                yield Item('', extension_id, record_id, '', profile, StorageSyncDB)
+            continue
+        for item, value in plugin.sync_parser(records, StorageSyncDB):
+            yield Item(plugin.name, extension_id, item, value, profile, StorageSyncDB)
+
+def get_storage_items(StorageJS, extension_id, profile):
+    plugin = plugins.get(extension_id)
+    with open(StorageJS, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0: #an empty file can't be memory-mapped
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        with Metrics.timer("extensions.storage"):
+            if plugin is None or plugin.storage_parser is None:
+                try:
+                    storage = json.loads(data[:])
+                except ValueError:
+                    storage = None
+                keys = sorted(storage) if isinstance(storage, dict) else [''] #not a JSON object: the file is listed anyway
+                items = [Item('', extension_id, key, '', profile, StorageJS) for key in keys]
+            else:
+                items = [Item(plugin.name, extension_id, item, value, profile, StorageJS)
+                         for item, value in plugin.storage_parser(data, StorageJS)]
+    finally:
+        data.close()
+    Metrics.count_file("extensions.file_size", StorageJS)
+    for item in items:
+        yield item
+
+def get_items(profile, wal=False):
+    #yields an Item record for each piece of data saved by the extensions of the profile
+    StorageSyncDB = os.path.join(profile, 'storage-sync.sqlite')
+    if os.path.isfile(StorageSyncDB):
+        for item in get_sync_items(StorageSyncDB, profile, wal):
+            yield item
+    extension_dir = os.path.join(profile, 'browser-extension-data')
+    if os.path.isdir(extension_dir):
+        for extension_id in sorted(os.listdir(extension_dir)):
+            StorageJS = os.path.join(extension_dir, extension_id, 'storage.js')
+            if os.path.isfile(StorageJS):
+                for item in get_storage_items(StorageJS, extension_id, profile):
+                    yield item
+
+def get_extensions(roots, fn, wal=False, format=None):
+    profiles = get_profiles(roots)
+    print "\nProfiles found: %d" % len(profiles)
+    errors = []
+    found  = {} # extension -> number of items
+    with Metrics.timer("output.write"):
+        with Output_Writers.get_writer(fn, ["Extension", "ExtensionID", "Item", "Value", "Profile", "File"], format) as writer:
+            for profile in profiles:
+                try:
+                    items = list(get_items(profile, wal))
+                except Exception as e:
+                    errors.append((profile, '%s: %s' % (type(e).__name__, e)))
+                    continue
+                for item in items:
+                    key = item.extension or item.extension_id
+                    found[key] = found.get(key, 0) + 1
+                writer.write_rows(items)
+    print "\nExtensions found: (%d)" % len(found)
+    for extension, count in sorted(found.items()):
+        print "- %s: %d item(s)" % (Firefox_NoScript.get_text(extension), count)
+    if len(errors) > 0:
+        print "\nThe following profiles could not be read: (%d)" % len(errors)
+        for profile, error in errors:
+            print "- %s (%s)" % (profile, error)
+    print "\nOutput saved to: %s" % fn
+
+def main(argv):
+    argv, fn, format = Output_Writers.get_output_args(argv, 'extensions')
+    argv, metrics_fn = Metrics.get_metrics_args(argv)
+    roots = []
+    wal   = False
+    for arg in argv[1:]:
+        if arg == '--wal':
+            wal = True
+        elif arg == '--default-path':
+            myOS     = platform.system()
+            username = getpass.getuser()
+            if myOS == 'Windows':
+                roots.append('C:/Users/' + username + '/AppData/Roaming/Mozilla/Firefox/Profiles')
+            if myOS == 'Linux':
+                roots.append('/home/' + username + '/.mozilla/firefox')
+            if myOS == 'Darwin':
+                roots.append('/Users/' + username + '/Library/Application Support/Firefox/Profiles')
+        elif os.path.isdir(arg):
+            roots.append(os.path.abspath(arg))
+        else:
+            print "\nThe following directory was not found: %s" % arg
+    if len(roots) > 0:
+        get_extensions(roots, fn, wal, format)
+        Metrics.write_summary(metrics_fn)
+    else:
+        get_help()
+
+#start
+if __name__ == '__main__':
+    main(sys.argv)
@@ -20,6 +20,7 @@ Blog      : http://forensenellanebbia.blogspot.it
 Version   : 20190122
 
 The script parses the 'storage.js' file used by Adblock Plus for Firefox and extracts the websites that have been whitelisted by the user.
+The file is memory-mapped and only the user subscriptions ('url=~user~...') are read, so large subscription lists are skipped.
 
 Firefox - Adblock Plus addon: https://addons.mozilla.org/en-US/firefox/addon/adblock-plus/
 Firefox - file location:
@@ -27,9 +28,17 @@ Firefox - file location:
  - Ubuntu: /home/<username>/.mozilla/firefox/<profileID>.default/browser-extension-data/{d10d0bf8-f5b5-c8b4-a8b2-2b9879e08c5d}/storage.js
  - macOS: /Users/<username>/Library/Application Support/Firefox/Profiles/<profileID>.default/browser-extension-data/{d10d0bf8-f5b5-c8b4-a8b2-2b9879e08c5d}/storage.js
 
-The script doesn't support yet Chrome since this browser uses LevelDBs instead of 'storage.js'.
-Adblock Plus: https://chrome.google.com/webstore/detail/adblock-plus/cfhdojbkjhnklbpkdaibdccddilifddb
-Chrome: C:\Users\<username>\AppData\Local\Google\Chrome\User Data\Default\Local Extension Settings\cfhdojbkjhnklbpkdaibdccddilifddb\[0-9]{6}.ldb
+Chrome stores the same data in a LevelDB instead of 'storage.js'. The script reads the '.ldb' and '.log' files of the
+LevelDB folder (read-only, without any third-party module) and only decodes the blocks holding the 'file:patterns.ini' key.
+Chrome - Adblock Plus addon: https://chrome.google.com/webstore/detail/adblock-plus/cfhdojbkjhnklbpkdaibdccddilifddb
+Chrome - folder location:
+ - Win: C:\Users\<username>\AppData\Local\Google\Chrome\User Data\Default\Local Extension Settings\cfhdojbkjhnklbpkdaibdccddilifddb
+ - Ubuntu: /home/<username>/.config/google-chrome/Default/Local Extension Settings/cfhdojbkjhnklbpkdaibdccddilifddb
+ - macOS: /Users/<username>/Library/Application Support/Google/Chrome/Default/Local Extension Settings/cfhdojbkjhnklbpkdaibdccddilifddb
+
+ The functions get_whitelist (storage.js) and get_whitelist_chrome (LevelDB folder) can also be imported:
+ they yield Whitelisted records (website, file) without printing anything.
+ The whitelisted websites are also saved to an output file (see Output_Writers.py for the formats).
 
  The script was tested with:
  - Python 2.7
@@ -37,75 +46,322 @@ Chrome: C:\Users\<username>\AppData\Local\Google\Chrome\User Data\Default\Local
  - Adblock Plus v3.4.2
 '''
 
+from collections import namedtuple
 import getpass
+import json
+import mmap
 import os
 import platform
 import re
+import struct
 import sys
 
+import Metrics
+import Output_Writers
+
+Whitelisted = namedtuple('Whitelisted', 'website file')
+
+# "[Subscription]","url=~user~<number>", followed by the properties of the subscription and by "[Subscription filters]"
+user_regex   = re.compile(r'"\[Subscription\]",\s*"url=~user~\d*",(?:\s*"[^"\[]*",)*?\s*"\[Subscription filters\]",')
+# a string of the list of filters and the separator that follows it
+filter_regex = re.compile(r'\s*"((?:[^"\\]|\\.)*)"\s*(,|\])')
+
+# Chrome: LevelDB keys holding the Adblock Plus filter lists
+chrome_keys  = ('file:patterns.ini',)
+chrome_id    = 'cfhdojbkjhnklbpkdaibdccddilifddb'
+firefox_id   = '{d10d0bf8-f5b5-c8b4-a8b2-2b9879e08c5d}' # browser-extension-data folder of Adblock Plus for Firefox
+table_magic  = struct.pack('<Q', 0xdb4775248b80fb57) # last 8 bytes of a .ldb file
+log_block    = 32768 # size of the blocks of a .log file
+
 #Functions
 def get_help():
     print '\nAnalysis of Adblock Plus for Firefox:\nscript to extract whitelisted websites added by user'
     print '\nExamples'
     print '  Analyze the Firefox profile path on the current system\n  python Firefox_AdblockPlus.py --default-path'
     print '\n  Analyze a specific storage.js file\n  python Firefox_AdblockPlus.py storage.js'
+    print '\n  Analyze the Chrome profile path on the current system\n  python Firefox_AdblockPlus.py --chrome-default-path'
+    print '\n  Analyze a specific Chrome LevelDB folder\n  python Firefox_AdblockPlus.py "Local Extension Settings/%s"' % chrome_id
+    print '\nOptions'
+    print '  --output FILE  : Output file (default: <date>_<time>_AdblockPlus.csv)'
+    print '  --format FORMAT: Output format: csv, jsonl or columnar (default: from the extension of the output file)'
+    print '  --metrics FILE : Save the time spent parsing and writing and the size of the files read to FILE (JSON)'
 
-def get_whitelisted(StorageJS):
-    match = re.search('"\[Subscription\]","url=~user~\d*","defaults=whitelist","","\[Subscription filters\]",',
-                      StorageJS)
+def get_websites(StorageJS):
+    #yields the websites whitelisted by the user; StorageJS can be a string or a memory-mapped file
+    pos = 0
+    while True:
+        match = user_regex.search(StorageJS, pos)
+        if match is None:
+            break
+        pos = match.end()
+        #read the filters one by one, up to the end of the user subscription
+        while True:
+            item = filter_regex.match(StorageJS, pos)
+            if item is None:
+                break
+            pos    = item.end()
+            text   = item.group(1)
+            if '\\' in text:
+                text = json.loads('"%s"' % text)
+            if text == '[Subscription]':
+                pos = item.start()
+                break
+            if text.startswith('@@||') and '^$document' in text:
+                yield text[len('@@||'):text.index('^$document')]
+            if item.group(2) == ']': #end of the list of filters
+                break
+
+def get_whitelist(path):
+    #yields a Whitelisted record for each website whitelisted by the user in the storage.js file
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0: #an empty file can't be memory-mapped
+            return
+        StorageJS = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
     try:
-        match_start = match.start()
-    except:
-        match_start = 0
-    if match_start > 0:
-        TextSelection = []
-        for char in range(match_start, len(StorageJS), 1):
-            TextSelection.append(StorageJS[char])
-        TextSelection = ''.join(TextSelection)
-        temp_list     = TextSelection.split(',')
-        whitelisted   = []
-        for item in temp_list:
-            if '@@||' in item:
-                if '^$document' in item:
-                    item = item.replace('@@||', '').replace('^$document', '')
-                    item = item.replace('"', '').replace('[', '').replace(']', '')
-                    whitelisted.append(item)
-        print '\nWhitelisted websites added by user: %d' % len(whitelisted)
-        for website in sorted(whitelisted):
-            print '- ' + website
-    else:
-        print '\nWhitelisted websites added by user: 0'
+        for website in get_websites(StorageJS):
+            yield Whitelisted(website, path)
+    finally:
+        StorageJS.close()
 
-#Start
-if len(sys.argv) == 2:
-    if sys.argv[1] == '--default-path':
-        myOS        = platform.system()
-        username    = getpass.getuser()
-        if myOS == 'Windows':
-            firefox_profile = 'C:/Users/' + username + '/AppData/Roaming/Mozilla/Firefox/Profiles'
-        if myOS == 'Linux':
-            firefox_profile = '/home/' + username + '/.mozilla/firefox'
-        if myOS == 'Darwin':
-            firefox_profile = '/Users/' + username + '/Library/Application Support/Firefox/Profiles'
-        try:
-            firefox_dirs = os.listdir(firefox_profile)
-            for firefox_dir in firefox_dirs:
-                if '.default' in firefox_dir:
-                    firefox_profile  = firefox_profile + '/' + firefox_dir + '/browser-extension-data/{d10d0bf8-f5b5-c8b4-a8b2-2b9879e08c5d}/storage.js'
-            StorageJS = open(firefox_profile, "r")
-            StorageJS = StorageJS.read()
-            print '\n# Analysis of Adblock Plus for Firefox #'
-            print 'File: %s' % firefox_profile
-            get_whitelisted(StorageJS)
-        except:
-            print '\nError - The following file was not found:\n%s' % firefox_profile
-    elif 'storage.js' in sys.argv[1].lower():
-        StorageJS = open(sys.argv[1], "r")
-        StorageJS = StorageJS.read()
+def get_varint(data, pos):
+    result = 0
+    shift  = 0
+    while True:
+        byte    = ord(data[pos])
+        pos    += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift  += 7
+
+def get_snappy(data):
+    #Snappy decompression: literals and back-references to the output already decompressed
+    length, pos = get_varint(data, 0)
+    output = bytearray()
+    while pos < len(data):
+        tag  = ord(data[pos])
+        pos += 1
+        if tag & 3 == 0: #literal
+            size = tag >> 2
+            if size >= 60:
+                n    = size - 59
+                size = sum(ord(data[pos + k]) << (8 * k) for k in range(n))
+                pos += n
+            size   += 1
+            output += data[pos:pos + size]
+            pos    += size
+            continue
+        if tag & 3 == 1:
+            size   = ((tag >> 2) & 7) + 4
+            offset = ((tag >> 5) << 8) | ord(data[pos])
+            pos   += 1
+        elif tag & 3 == 2:
+            size   = (tag >> 2) + 1
+            offset = struct.unpack('<H', data[pos:pos + 2])[0]
+            pos   += 2
+        else:
+            size   = (tag >> 2) + 1
+            offset = struct.unpack('<I', data[pos:pos + 4])[0]
+            pos   += 4
+        start = len(output) - offset
+        if offset == 0 or start < 0:
+            raise ValueError('invalid Snappy back-reference')
+        if offset >= size:
+            output += output[start:start + size]
+        else: #the copy overlaps the bytes it produces
+            for k in range(size):
+                output.append(output[start + k])
+    if len(output) != length:
+        raise ValueError('invalid Snappy block length')
+    return str(output)
+
+def get_block(f, offset, size):
+    #a block is followed by 1 byte (compression type) and 4 bytes (CRC)
+    f.seek(offset)
+    data = f.read(size + 1)
+    if len(data) != size + 1:
+        raise ValueError('truncated block')
+    if data[size] == '\x01':
+        return get_snappy(data[:size])
+    return data[:size]
+
+def get_block_entries(block):
+    #yields (key, value); keys are prefix-compressed against the previous key
+    num_restarts = struct.unpack('<I', block[-4:])[0]
+    end = len(block) - 4 - 4 * num_restarts
+    pos = 0
+    key = ''
+    while pos < end:
+        shared, pos     = get_varint(block, pos)
+        non_shared, pos = get_varint(block, pos)
+        value_len, pos  = get_varint(block, pos)
+        key  = key[:shared] + block[pos:pos + non_shared]
+        pos += non_shared
+        yield key, block[pos:pos + value_len]
+        pos += value_len
+
+def get_table_values(path, user_keys):
+    #yields (key, sequence, type, value) from a .ldb file, reading only the data blocks that can hold the keys
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        if f.tell() < 48:
+            return
+        f.seek(-48, 2)
+        footer = f.read(48)
+        if footer[-8:] != table_magic:
+            return
+        metaindex_offset, pos = get_varint(footer, 0)
+        metaindex_size, pos   = get_varint(footer, pos)
+        index_offset, pos     = get_varint(footer, pos)
+        index_size, pos       = get_varint(footer, pos)
+        index = list(get_block_entries(get_block(f, index_offset, index_size)))
+        for user_key in sorted(user_keys):
+            for index_key, handle in index:
+                #the key of an index entry is >= every key of its data block
+                if index_key[:-8] < user_key:
+                    continue
+                offset, pos = get_varint(handle, 0)
+                size, pos   = get_varint(handle, pos)
+                past_key    = False
+                for key, value in get_block_entries(get_block(f, offset, size)):
+                    if key[:-8] == user_key:
+                        tag = struct.unpack('<Q', key[-8:])[0]
+                        yield user_key, tag >> 8, tag & 0xff, value
+                    elif key[:-8] > user_key:
+                        past_key = True
+                        break
+                if past_key:
+                    break
+
+def get_log_values(path, user_keys):
+    #yields (key, sequence, type, value) from the write batches of a .log file
+    with open(path, 'rb') as f:
+        record = ''
+        while True:
+            block = f.read(log_block)
+            if not block:
+                break
+            pos = 0
+            while pos + 7 <= len(block):
+                checksum, length, record_type = struct.unpack('<IHB', block[pos:pos + 7])
+                if record_type == 0: #preallocated, zero-filled space
+                    break
+                data = block[pos + 7:pos + 7 + length]
+                pos += 7 + length
+                if record_type == 1:   #FULL
+                    batch = data
+                elif record_type == 2: #FIRST
+                    record = data
+                    continue
+                elif record_type == 3: #MIDDLE
+                    record += data
+                    continue
+                elif record_type == 4: #LAST
+                    batch  = record + data
+                    record = ''
+                else:
+                    break
+                if len(batch) < 12:
+                    continue
+                sequence, count = struct.unpack('<QI', batch[:12])
+                bpos = 12
+                for n in range(count):
+                    value_type = ord(batch[bpos])
+                    key_len, bpos = get_varint(batch, bpos + 1)
+                    key   = batch[bpos:bpos + key_len]
+                    bpos += key_len
+                    value = None
+                    if value_type == 1:
+                        value_len, bpos = get_varint(batch, bpos)
+                        value = batch[bpos:bpos + value_len]
+                        bpos += value_len
+                    if key in user_keys:
+                        yield key, sequence + n, value_type, value
+
+def get_whitelist_chrome(leveldb_dir):
+    #yields a Whitelisted record for each website whitelisted by the user in the LevelDB folder used by Chrome
+    latest = {} #key -> (sequence, type, value, file); the highest sequence number is the current value
+    for name in sorted(os.listdir(leveldb_dir)):
+        path = os.path.join(leveldb_dir, name)
+        if name.endswith('.ldb') or name.endswith('.sst'):
+            values = get_table_values(path, chrome_keys)
+        elif name.endswith('.log'):
+            values = get_log_values(path, chrome_keys)
+        else:
+            continue
+        for key, sequence, value_type, value in values:
+            if key not in latest or sequence > latest[key][0]:
+                latest[key] = (sequence, value_type, value, path)
+    for key, (sequence, value_type, value, path) in sorted(latest.items()):
+        if value_type == 1: #0 means that the key was deleted
+            for website in get_websites(value):
+                yield Whitelisted(website, path)
+
+def get_whitelisted(path, fn=None, format=None):
+    with Metrics.timer('abp.parse'):
+        if os.path.isdir(path):
+            whitelisted = list(get_whitelist_chrome(path))
+        else:
+            whitelisted = list(get_whitelist(path))
+    Metrics.count_file('abp.file_size', path)
+    if os.path.isdir(path):
+        print '\n# Analysis of Adblock Plus for Chrome #'
+        print 'Folder: %s' % path
+    else:
         print '\n# Analysis of Adblock Plus for Firefox #'
-        print 'File: %s' % os.path.abspath(sys.argv[1])
-        get_whitelisted(StorageJS)
+        print 'File: %s' % path
+    print '\nWhitelisted websites added by user: %d' % len(whitelisted)
+    for website in sorted(record.website for record in whitelisted):
+        print '- ' + website
+    if fn is not None:
+        with Metrics.timer('output.write'):
+            with Output_Writers.get_writer(fn, ['Website', 'File'], format, append=True) as writer:
+                writer.write_rows(sorted(whitelisted))
+        print '\nOutput saved to: %s' % fn
+
+def main(argv):
+    argv, fn, format = Output_Writers.get_output_args(argv, 'AdblockPlus')
+    argv, metrics_fn = Metrics.get_metrics_args(argv)
+    if len(argv) == 2:
+        if argv[1] == '--default-path':
+            myOS        = platform.system()
+            username    = getpass.getuser()
+            if myOS == 'Windows':
+                firefox_profile = 'C:/Users/' + username + '/AppData/Roaming/Mozilla/Firefox/Profiles'
+            if myOS == 'Linux':
+                firefox_profile = '/home/' + username + '/.mozilla/firefox'
+            if myOS == 'Darwin':
+                firefox_profile = '/Users/' + username + '/Library/Application Support/Firefox/Profiles'
+            try:
+                firefox_dirs = os.listdir(firefox_profile)
+                for firefox_dir in firefox_dirs:
+                    if '.default' in firefox_dir:
+                        firefox_profile  = firefox_profile + '/' + firefox_dir + '/browser-extension-data/' + firefox_id + '/storage.js'
+                get_whitelisted(firefox_profile, fn, format)
+            except:
+                print '\nError - The following file was not found:\n%s' % firefox_profile
+        elif argv[1] == '--chrome-default-path':
+            myOS        = platform.system()
+            username    = getpass.getuser()
+            if myOS == 'Windows':
+                chrome_profile = 'C:/Users/' + username + '/AppData/Local/Google/Chrome/User Data/Default'
+            if myOS == 'Linux':
+                chrome_profile = '/home/' + username + '/.config/google-chrome/Default'
+            if myOS == 'Darwin':
+                chrome_profile = '/Users/' + username + '/Library/Application Support/Google/Chrome/Default'
+            chrome_profile = chrome_profile + '/Local Extension Settings/' + chrome_id
+            if os.path.isdir(chrome_profile):
+                get_whitelisted(chrome_profile, fn, format)
+            else:
+                print '\nError - The following folder was not found:\n%s' % chrome_profile
+        elif 'storage.js' in argv[1].lower() or os.path.isdir(argv[1]):
+            get_whitelisted(os.path.abspath(argv[1]), fn, format)
+        else:
+            get_help()
     else:
         get_help()
-else:
-    get_help()
\ No newline at end of file
+    Metrics.write_summary(metrics_fn)
+
+#Start
+if __name__ == '__main__':
+    main(sys.argv)
\ No newline at end of file
@@ -26,33 +26,175 @@ Windows: C:\Users\<username>\AppData\Roaming\Mozilla\Firefox\Profiles\<profileID
 Ubuntu : /home/<username>/.mozilla/firefox/<profileID>.default/storage-sync.sqlite
 macOS  : /Users/<username>/Library/Application Support/Firefox/Profiles/<profileID>.default/storage-sync.sqlite
 
+The file is opened read-only (immutable), so that no journal or -wal/-shm file is created next to the evidence.
+With --wal, the file and its -wal file are copied to a temporary folder and the records of the -wal file are read too.
+
+With --record FILE, the HTTP responses received with -r are saved to an archive; with --replay FILE (or a folder of
+WARC files) the sites are classified from the saved responses, without sending any request (see Response_Store.py).
+
+Before the HTTP requests of -r, the host names are resolved in parallel: the sites that don't resolve (e.g. dead
+trackers) are not requested at all. With --cache the DNS answers are reused by the next runs; with --hosts FILE the
+names are resolved with a hosts file instead of DNS queries.
+
+The functions get_permissions and get_visits can also be imported: they return Permission and Visit records
+without printing or writing anything.
+
 The script was tested with:
 - Python 2.7
 - Firefox v64.0.2
 - NoScript v10.2.1
 '''
 
-from collections import Counter
-from datetime import datetime
+from collections import Counter, namedtuple
+import codecs
 import getpass
+import hashlib
+import httplib
 import json
+import Metrics
 import os
+import Output_Writers
 import platform
+import Queue
 import re
+import Response_Store
+import Results_Cache
+import shutil
+import socket
 import sqlite3
 import ssl
 import sys
-import urllib2
+import tempfile
+import threading
+import time
+import urllib
+import urlparse
+
+# Permission: a non-default site found in the NoScript policy
+# Visit     : a row of the -r output (Site,TrustLevel,Visited,HttpResponse,Content-Length,ResponseURL,BodySHA256,File)
+# Capture   : what is kept of a response body: the URLs of the resources it loads and the SHA-256 of the bytes read
+Permission = namedtuple('Permission', 'site trust_level file')
+Visit      = namedtuple('Visit', 'site trust_level visited http_response content_length response_url body_sha256 file')
+Capture    = namedtuple('Capture', 'references sha256 size truncated')
+
+visit_header = ["Site", "TrustLevel", "Visited", "HttpResponse", "Content-Length", "ResponseURL", "BodySHA256", "File"]
+
+user_agent      = 'Mozilla/5.0 (Windows NT 6.1; WOW64; rv:64.0) Gecko/20100101 Firefox/64.0'
+probe_timeout   = 3   # seconds per HTTP request
+probe_redirects = 5   # maximum number of redirects followed per site
+probe_per_host  = 2   # maximum number of concurrent connections to the same host
+probe_workers   = 16  # maximum number of concurrent connections (--workers)
+probe_deadline  = 300 # seconds available to probe all the sites (--deadline)
+probe_max_body  = 1024 * 1024 # bytes read from a response body (--max-body), the rest is not downloaded
+probe_body_time = 10  # seconds spent reading a response body
+probe_chunk     = 64 * 1024
+probe_hosts     = {}  # host -> semaphore
+probe_lock      = threading.Lock()
+probe_addresses = {}  # host name -> IP addresses found by the pre-resolution ([] if the host doesn't resolve)
+dns_workers     = 32  # concurrent DNS queries of the pre-resolution
+dns_not_found   = set(getattr(socket, name) for name in ('EAI_NONAME', 'EAI_NODATA') if hasattr(socket, name))
+ip_regex        = re.compile(r'^\d+\.\d+\.\d+\.\d+$')
+
+noscript_id         = '{73a6fe31-595d-460b-a920-fcc0f8843232}'
+noscript_collection = 'default/' + noscript_id
+secure_prefix       = u'\xa7:' # '\xa7:example.com' = example.com, HTTPS only
+sqlite_state        = {}  # 'uri' -> whether SQLite accepts URI file names
+
+#search lines in HTML source code that load scripts (<script src>, <iframe src>, <link rel=preload|prefetch|preconnect|dns-prefetch>)
+script_regex = re.compile('<(?:script|iframe|wsc)?[ \.]?(?:type="text/javascript"|type=\'text/javascript\'|async)?[ \.\r\n]*src([a-zA-Z0-9="\'\\\./:%_-]*)|' +
+                          '<link rel=["|\']+(?:preload|prefetch|preconnect|dns-prefetch)+([a-zA-Z0-9\.="-:/ ]*)')
+
+# From NoScript v10.2.1: default list of trusted sites
+# (From NoScript v10.2.1: default list of untrusted sites is empty)
+sites_trusted_default = "addons.mozilla.org", "afx.ms", "ajax.aspnetcdn.com", "ajax.googleapis.com", "bootstrapcdn.com", "code.jquery.com", "firstdata.com", "firstdata.lv", "gfx.ms", "google.com", "googlevideo.com", "gstatic.com", "hotmail.com", "live.com", "live.net", "maps.googleapis.com", "mozilla.net", "netflix.com", "nflxext.com", "nflximg.com", "nflxvideo.net", "noscript.net", "outlook.com", "passport.com", "passport.net", "passportimages.com", "paypal.com", "paypalobjects.com", "securecode.com", "securesuite.net", "sfx.ms", "tinymce.cachefly.net", "wlxrs.com", "yahoo.com", "yahooapis.com", "yimg.com", "youtube.com", "ytimg.com"
+
+# default lists of trusted sites by NoScript version: the list of the newest version that is not newer than the one
+# of the profile is used (the newest list if the version is unknown); more lists can be loaded with --trusted-default
+trusted_defaults = {"10.2.1": sites_trusted_default}
+trusted_indexes  = {}  # version -> TrustedIndex
+
+class TrustedIndex(object):
+    #tree of the reversed labels of the default trusted sites (google.com -> com -> google): a site is trusted by default
+    #if its host or one of its parent domains is in the list (e.g. www.google.com, https://google.com); O(labels) lookups
+
+    def __init__(self, sites):
+        self.root = {}
+        for site in sites:
+            host = get_hostname(site)
+            if host == "":
+                continue
+            node = self.root
+            for label in reversed(host.split('.')):
+                node = node.setdefault(label, {})
+            node[""] = {}
+
+    def __contains__(self, site):
+        node = self.root
+        for label in reversed(get_hostname(site).split('.')):
+            node = node.get(label)
+            if node is None:
+                return False
+            if "" in node:
+                return True
+        return False
+
+class SQLiteConnection(object):
+    #read-only connection to a storage-sync.sqlite file: nothing is ever written next to the evidence
+
+    def __init__(self, StorageSyncDB, wal=False):
+        if os.path.isfile(StorageSyncDB) == False:
+            raise IOError("File not found: %s" % StorageSyncDB)
+        self.temp_dir = None
+        if wal or has_sqlite_uri() == False:
+            #work on a temporary copy, where SQLite can also replay the records of the -wal file
+            self.temp_dir = tempfile.mkdtemp(prefix="NoScript_")
+            try:
+                temp_db = os.path.join(self.temp_dir, "storage-sync.sqlite")
+                shutil.copy2(StorageSyncDB, temp_db)
+                if wal and os.path.isfile(StorageSyncDB + "-wal"):
+                    shutil.copy2(StorageSyncDB + "-wal", temp_db + "-wal")
+                self.connect = sqlite3.connect(temp_db)
+            except:
+                shutil.rmtree(self.temp_dir, ignore_errors=True)
+                raise
+        else:
+            #immutable=1: no locks, no journal and no -wal/-shm files, which also makes it fast on network shares
+            self.connect = sqlite3.connect("file:%s?mode=ro&immutable=1" % urllib.pathname2url(os.path.abspath(StorageSyncDB)))
+        self.connect.text_factory = str
+
+    def __enter__(self):
+        return self.connect
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connect.close()
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+        return False
 
 #functions
 def get_help():
     print "\nScript to extract the permissions that have been manually added to NoScript add-on"
     print "\nOPTIONS:"
     print "--default-path: Find and analyze the storage-sync.sqlite file in the Firefox profile path on the current system" #]\n==> python Firefox_NoScript.py --default-path"
+    print "--wal: Also read the records of the storage-sync.sqlite-wal file (from a temporary copy)"
     print "-r: Send a HTTP request to the sites found in the storage-sync.sqlite file to try to determine which of them may have been directly visited by the user"
+    print "--workers N: Maximum number of concurrent HTTP connections used by -r (default: %d)" % probe_workers
+    print "--deadline S: Maximum number of seconds spent sending HTTP requests with -r (default: %d)" % probe_deadline
+    print "--max-body BYTES: Maximum number of bytes read from each HTTP response with -r, the rest is not downloaded (default: %d)" % probe_max_body
+    print "--cache FILE: Keep the HTTP responses (%d hours) and the DNS answers (%d hours) in FILE and reuse them in the next runs with -r" % (
+          Results_Cache.probe_ttl / 3600, Results_Cache.dns_ttl / 3600)
+    print "--trusted-default FILE: Load more default lists of trusted sites from FILE (JSON: {\"<NoScript version>\": [\"site\", ...]})"
+    print "--hosts FILE: Resolve the sites with a hosts file instead of DNS queries (the sites missing from FILE are not requested)"
+    print "--record FILE: Save the HTTP responses received with -r to FILE (a ZIP archive)"
+    print "--replay PATH: Classify the sites (as -r does) with the HTTP responses saved by --record in PATH, or in a folder of WARC files, without sending any request"
+    print "--metrics FILE: Save the time spent in each phase (SQLite, JSON, DNS, TLS, downloads, regex...) and the HTTP latency of each host to FILE (JSON)"
+    print "--output FILE: Output file of -r (default: <date>_<time>_NoScript.csv)"
+    print "--format FORMAT: Output format of -r: csv, jsonl or columnar (default: from the extension of the output file)"
     print "\nEXAMPLES:"
     print "python Firefox_NoScript.py --default-path [-r]"
-    print "python Firefox_NoScript.py storage-sync.sqlite [-r]"
+    print "python Firefox_NoScript.py storage-sync.sqlite [-r] [--workers 32] [--deadline 600] [--cache case123.cache]"
+    print "python Firefox_NoScript.py storage-sync.sqlite -r --record case123_responses.zip"
+    print "python Firefox_NoScript.py storage-sync.sqlite --replay case123_responses.zip"
 
 def get_version():
     script_name    = "Firefox_NoScript"
@@ -60,197 +202,635 @@ def get_version():
     script_descr   = "Script to extract the permissions that have been manually added to NoScript add-on"
     print "\n%s v.%s\n%s" % (script_name,script_version,script_descr)
 
-def get_sites(StorageSyncDB):
-    connect = sqlite3.connect(StorageSyncDB)
-    cursor  = connect.cursor()
-    cursor.execute(
-        "SELECT record FROM collection_data WHERE collection_name = 'default/{73a6fe31-595d-460b-a920-fcc0f8843232}' AND record_id = 'key-policy'")
-    record = str(cursor.fetchall())
-    connect.close()
-    record = record.replace("[(u'", "").replace("',)]", "").replace("\\xa7:", "")
-    sites  = json.loads(record)
-    get_version()
-    print '\nAnalyzing file: %s ...' % StorageSyncDB
+def get_option(argv, name, default):
+    #positive integer value of an option (--workers, --deadline, --max-body), default if missing or invalid
+    if name in argv:
+        try:
+            value = int(argv[argv.index(name) + 1])
+            if value >= 1:
+                return value
+        except (IndexError, ValueError):
+            pass
+        print "\nInvalid value for %s, using the default value: %d" % (name, default)
+    return default
+
+def get_host_semaphore(host):
+    with probe_lock:
+        if host not in probe_hosts:
+            probe_hosts[host] = threading.Semaphore(probe_per_host)
+        return probe_hosts[host]
+
+def get_connection(conns, scheme, host, timeout):
+    conn = conns.get((scheme, host))
+    if conn is None:
+        if scheme == "https":
+            context = ssl._create_unverified_context() #avoid "SSL: CERTIFICATE_VERIFY_FAILED" error
+            conn    = httplib.HTTPSConnection(host, timeout=timeout, context=context)
+        else:
+            conn    = httplib.HTTPConnection(host, timeout=timeout)
+        conns[(scheme, host)] = conn
+    else:
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+    return conn
+
+def get_body(res, max_body, deadline):
+    #reads at most max_body bytes of the body; returns (body, whether the whole body was read)
+    chunks   = []
+    size     = 0
+    deadline = min(deadline, time.time() + probe_body_time)
+    while size < max_body and time.time() < deadline:
+        chunk = res.read(min(probe_chunk, max_body - size))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    return "".join(chunks), res.isclosed()
+
+def get_addresses(host):
+    #system resolver: IP addresses of host, [] if the name doesn't exist (socket.gaierror for the other errors)
+    try:
+        return sorted(set(info[4][0] for info in socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM)))
+    except socket.gaierror as e:
+        if e.args[0] in dns_not_found:
+            return []
+        raise
+
+def get_hosts_resolver(fn):
+    #stub resolver that reads a hosts file ("address name [name...]"): the names missing from the file don't resolve
+    hosts = {}
+    with open(fn, "rb") as f:
+        for line in f:
+            fields = line.split('#', 1)[0].split()
+            for name in fields[1:]:
+                hosts.setdefault(name.lower().rstrip('.'), []).append(fields[0])
+    return lambda host: hosts.get(host, [])
+
+def get_resolved(hosts, deadline, cache=None, resolver=None):
+    #resolves the host names in parallel before any HTTP request and returns {host: IP addresses, [] if it doesn't resolve}
+    #hosts with a temporary error (e.g. a DNS timeout) are missing from the result: they are requested as usual
+    #the answers are kept in probe_addresses for the next profiles, and in the cache (system resolver only) for the next runs
+    resolved = {}
+    pending  = Queue.Queue()
+    for host in sorted(set(hosts)):
+        if ip_regex.match(host) or ':' in host:
+            resolved[host] = [host]
+        elif host in probe_addresses:
+            resolved[host] = probe_addresses[host]
+        else:
+            addresses = None
+            if cache is not None and resolver is None:
+                addresses = cache.get('dns|%d|%s' % (Results_Cache.cache_version, host))
+            if addresses is None:
+                pending.put(host)
+            else:
+                resolved[host] = addresses
+    Metrics.count("dns.cached", len(resolved))
+    answers  = {}
+    deadline = time.time() + deadline
+    def worker():
+        while time.time() < deadline: #after the deadline, an abandoned thread doesn't start new queries
+            try:
+                host = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                answers[host] = (resolver or get_addresses)(host)
+            except Exception:
+                Metrics.count("dns.errors")
+    threads = [threading.Thread(target=worker) for n in range(min(dns_workers, pending.qsize()))]
+    for thread in threads:
+        thread.daemon = True #a query still running at the deadline is abandoned
+        thread.start()
+    for thread in threads:
+        thread.join(max(0, deadline - time.time()))
+    answers = dict(answers) #the abandoned queries can't add answers any more
+    if cache is not None and resolver is None:
+        for host, addresses in answers.items():
+            cache.put('dns|%d|%s' % (Results_Cache.cache_version, host), addresses,
+                      Results_Cache.dns_ttl if addresses else Results_Cache.dns_negative_ttl)
+    probe_addresses.update(answers)
+    resolved.update(answers)
+    return resolved
+
+def get_socket(conn, scheme, timeout, addresses):
+    #connects to the first address that accepts the connection, so that the resolver is not asked again
+    for address in addresses:
+        try:
+            sock = socket.create_connection((address, conn.port), timeout)
+            break
+        except socket.error:
+            if address == addresses[-1]:
+                raise
+    if scheme == "https":
+        sock = conn._context.wrap_socket(sock, server_hostname=conn.host)
+    return sock
+
+def get_response(url, headers, deadline, conns, max_body=probe_max_body):
+    #sends one GET request (redirects are not followed) and returns a Response_Store.Response
+    #only the body of a final response is read (up to max_body bytes): redirects and errors are not downloaded
+    url_parts = urlparse.urlsplit(url)
+    host      = url_parts.netloc
+    path      = url_parts.path or "/"
+    if url_parts.query:
+        path += "?" + url_parts.query
+    semaphore = get_host_semaphore(host)
+    while not semaphore.acquire(False): #wait for a free connection slot to the host
+        if time.time() >= deadline:
+            raise IOError("deadline exceeded")
+        time.sleep(0.05)
+    try:
+        timeout = min(probe_timeout, deadline - time.time())
+        if timeout <= 0:
+            raise IOError("deadline exceeded")
+        conn    = get_connection(conns, url_parts.scheme, host, timeout)
+        s_time  = time.time()
+        try:
+            if conn.sock is None and probe_addresses.get(conn.host.lower()):
+                with Metrics.timer("probe.tls" if url_parts.scheme == "https" else "probe.connect"):
+                    conn.sock = get_socket(conn, url_parts.scheme, timeout, probe_addresses[conn.host.lower()])
+            elif Metrics.metrics is not None and conn.sock is None:
+                #the phases of a new connection are timed separately (DNS, then TCP and the TLS handshake):
+                #the connection is made to the addresses just resolved, so that the timed resolution is the one used
+                with Metrics.timer("probe.dns"):
+                    addresses = [info[4][0] for info in socket.getaddrinfo(conn.host, conn.port, 0, socket.SOCK_STREAM)]
+                with Metrics.timer("probe.tls" if url_parts.scheme == "https" else "probe.connect"):
+                    conn.sock = get_socket(conn, url_parts.scheme, timeout, addresses)
+            with Metrics.timer("probe.request"):
+                conn.request("GET", path, headers=headers)
+                res  = conn.getresponse()
+            with Metrics.timer("probe.body"):
+                if res.status in (301, 302, 303, 307, 308) or res.status >= 400:
+                    body, complete = get_body(res, 4096, deadline) #a short body keeps the connection reusable
+                    body = ""
+                else:
+                    body, complete = get_body(res, max_body, deadline)
+        except:
+            Metrics.count("probe.errors")
+            conn.close()
+            del conns[(url_parts.scheme, host)]
+            raise
+        if res.will_close or not complete: #the rest of the body is never read
+            conn.close()
+            del conns[(url_parts.scheme, host)]
+    finally:
+        semaphore.release()
+    Metrics.observe(host, time.time() - s_time)
+    Metrics.count("probe.requests")
+    Metrics.count("probe.bytes", len(body))
+    return Response_Store.Response(url, res.status, res.getheaders(), body)
+
+def get_url(url, headers, deadline, conns, store=None, max_body=probe_max_body):
+    #follow the redirects by hand so that connections to the same host are reused
+    #a store (Response_Store) records the responses, or replays them instead of sending the requests
+    for hop in range(probe_redirects + 1):
+        if store is not None and not store.record:
+            res = store.get(url)
+            if res is None:
+                raise IOError("%s not found in the response store" % url)
+        else:
+            res = get_response(url, headers, deadline, conns, max_body)
+            if store is not None:
+                store.put(res)
+        location = Response_Store.get_header(res, "location")
+        if res.status in (301, 302, 303, 307, 308) and location:
+            url = urlparse.urljoin(url, location)
+        elif res.status >= 400:
+            raise IOError("HTTP Error %d" % res.status)
+        else:
+            return url, Response_Store.get_header(res, "content-length"), res.body[:max_body]
+    raise IOError("too many redirects")
+
+def get_capture(body, max_body):
+    return Capture(get_references(body), hashlib.sha256(body).hexdigest(), len(body), len(body) >= max_body)
+
+def get_probe(site, deadline, store=None, max_body=probe_max_body):
+    #returns (response URL, Content-Length, Capture of the body); the response URL is empty if the site didn't answer
+    #the body itself is not kept, so that memory doesn't grow with the number of sites
+    url   = "http://" + get_host(site)
+    conns = {}
+    try:
+        for headers in ({}, {'User-Agent': user_agent}): #retry with a User-Agent header
+            try:
+                res_url, content_length, body = get_url(url, headers, deadline, conns, store, max_body)
+                break
+            except Exception:
+                res_url, content_length, body = "", None, ""
+    finally:
+        for conn in conns.values():
+            conn.close()
+    if content_length is not None:
+        try:
+            content_length = int(content_length)
+        except ValueError:
+            content_length = None
+    return res_url, content_length, get_capture(body, max_body) if res_url else None
+
+def get_probes(sites, workers, deadline, store=None, max_body=probe_max_body):
+    deadline = time.time() + deadline
+    pending  = Queue.Queue()
+    probes   = {}
+    for site in sorted(sites):
+        pending.put(site)
+    def worker():
+        while True:
+            try:
+                site = pending.get_nowait()
+            except Queue.Empty:
+                return
+            probes[site] = get_probe(site, deadline, store, max_body)
+    threads = [threading.Thread(target=worker) for n in range(min(max(1, workers), len(sites)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return probes
+
+def get_trie(domains):
+    #character trie of the domains: "" marks the end of a domain
+    trie = {}
+    for domain in domains:
+        node = trie
+        for char in domain:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return trie
+
+def get_trie_regex(trie):
+    #nested alternation over the characters shared by the domains, so that a position is tested against all of them at once
+    def get_branch(node):
+        branches = [re.escape(char) + get_branch(child) for char, child in sorted(node.items()) if char != ""]
+        if len(branches) == 0:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        return "(?:%s)%s" % ("|".join(branches), "?" if "" in node else "")
+    return get_branch(trie)
+
+def get_references(body):
+    #single pass over the body: the URL of every tag that loads a resource, the only part of a body the classification needs
+    references = set()
+    for tag in script_regex.finditer(body):
+        references.add(tag.group(1) if tag.group(1) is not None else tag.group(2))
+    return tuple(sorted(references))
+
+def get_included(references, domain_regex, trie):
+    #domains found in the URLs of the resources loaded by a page
+    #the regex only captures the longest domain at a position: the trie gives the shorter ones (example.com in example.com.au)
+    included = set()
+    for url in references:
+        for hit in domain_regex.finditer(url):
+            domain = hit.group(1)
+            included.add(domain)
+            node = trie
+            for end, char in enumerate(domain[:-1], 1):
+                node = node.get(char)
+                if node is None:
+                    break
+                if "" in node:
+                    included.add(domain[:end])
+    return included
+
+def get_text(value):
+    #UTF-8 for the console and the output file (sites may be internationalized domain names)
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+def get_host(site):
+    #internationalized domain names are sent and compared in their ASCII (punycode) form
+    try:
+        return site.rstrip().encode('idna')
+    except UnicodeError:
+        return get_text(site.rstrip())
+
+def get_hostname(site):
+    #lowercase host name of a site in ASCII (punycode) form, without the HTTPS-only prefix, scheme, user, port, path and
+    #trailing dot: '\xa7:Google.com.', 'https://google.com:443/' and 'Google.com:8080' -> 'google.com'; '' without a valid host
+    #used by the DNS stage, the index of the default trusted sites and Timeline_Correlation.py
+    site = get_site(Output_Writers.get_value(site).strip())
+    if '/' in site or ':' in site or '@' in site:
+        if '://' not in site:
+            site = 'http://' + site
+        try:
+            site = urlparse.urlsplit(site).hostname or ''
+        except ValueError:
+            return ''
+    host = site.lower().rstrip('.')
+    try:
+        return host.encode('ascii') #a host name, as saved by most versions: no IDNA encoding needed
+    except UnicodeError:
+        return get_host(host)
+
+def has_sqlite_uri():
+    #Python 2.7 can't ask SQLite for URI file names: check whether the SQLite library accepts them anyway
+    if 'uri' not in sqlite_state:
+        temp_dir = tempfile.mkdtemp(prefix="NoScript_")
+        try:
+            probe_db = os.path.join(temp_dir, "uri.sqlite")
+            connect  = sqlite3.connect(probe_db)
+            connect.execute("CREATE TABLE uri (x)")
+            connect.close()
+            try:
+                connect = sqlite3.connect("file:%s?mode=ro" % urllib.pathname2url(probe_db))
+                connect.execute("SELECT x FROM uri")
+                connect.close()
+                sqlite_state['uri'] = True
+            except sqlite3.Error:
+                sqlite_state['uri'] = False
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    return sqlite_state['uri']
+
+def get_sqlite_connection(StorageSyncDB, wal=False):
+    #read-only connection to a file, used with 'with': it is closed (and its temporary copy deleted) at the end of the block
+    return SQLiteConnection(StorageSyncDB, wal)
+
+def get_records(StorageSyncDB, wal=False):
+    #returns {record_id: record} for every NoScript row of collection_data (one query on the primary key)
+    with Metrics.timer("noscript.sqlite"):
+        with get_sqlite_connection(StorageSyncDB, wal) as connect:
+            cursor  = connect.execute("SELECT record_id, record FROM collection_data WHERE collection_name = ?", (noscript_collection,))
+            records = dict((record_id, get_bytes(record)) for record_id, record in cursor)
+    Metrics.count_file("noscript.file_size", StorageSyncDB)
+    return records
+
+def get_bytes(record):
+    #the record column is read as UTF-8 bytes (text_factory = str); BLOB values come back as buffers
+    if isinstance(record, buffer):
+        record = str(record)
+    if record is not None and record.startswith(codecs.BOM_UTF8):
+        record = record[len(codecs.BOM_UTF8):]
+    return record
+
+def get_policy(record):
+    #a single json.loads over the UTF-8 bytes: the strings are decoded while parsing, without other copies of the record
+    return json.loads(record, encoding='utf-8')
+
+def get_site(site):
+    #NoScript marks the sites that are trusted only over HTTPS with the '\xa7:' prefix
+    if site.startswith(secure_prefix):
+        return site[len(secure_prefix):]
+    return site
+
+def get_version_key(version):
+    #'10.2.1' -> (10, 2, 1)
+    return tuple(int(number) for number in re.findall(r'\d+', version))
+
+def get_noscript_version(policy, StorageSyncDB):
+    #version saved in the policy, otherwise the version of the add-on listed in extensions.json (same profile folder)
+    version = policy.get('data', {}).get('version')
+    if isinstance(version, basestring):
+        return version
+    try:
+        with open(os.path.join(os.path.dirname(StorageSyncDB), 'extensions.json'), 'rb') as f:
+            for addon in json.load(f).get('addons', []):
+                if addon.get('id') == noscript_id:
+                    return addon.get('version')
+    except (IOError, ValueError, AttributeError):
+        pass
+    return None
+
+def get_trusted_default(version=None):
+    #TrustedIndex of the default trusted sites of a NoScript version (None: the newest list)
+    versions = sorted(trusted_defaults, key=get_version_key)
+    selected = versions[-1]
+    if version:
+        older    = [item for item in versions if get_version_key(item) <= get_version_key(version)]
+        selected = older[-1] if len(older) > 0 else versions[0]
+    if selected not in trusted_indexes:
+        trusted_indexes[selected] = TrustedIndex(trusted_defaults[selected])
+    return trusted_indexes[selected]
+
+def add_trusted_defaults(fn):
+    with open(fn, 'rb') as f:
+        for version, sites in json.load(f).items():
+            trusted_defaults[version] = tuple(sites)
+            trusted_indexes.pop(version, None)
+
+def get_permissions(StorageSyncDB, trusted_default=None, wal=False):
+    #yields a Permission record for each site that is not in NoScript's default list of trusted sites
+    #(the list of the NoScript version of the profile, unless trusted_default is given)
+    #a file without the NoScript policy (e.g. a profile without NoScript) has no permissions
+    return get_policy_permissions(get_records(StorageSyncDB, wal).get('key-policy'), StorageSyncDB, trusted_default)
+
+def get_policy_permissions(record, StorageSyncDB, trusted_default=None):
+    #same as get_permissions, from the 'key-policy' record already read (e.g. by Extension_Storage.py)
+    if record is None: #missing row, or NULL record
+        return
+    with Metrics.timer("noscript.json"):
+        sites = get_policy(record)
+    if trusted_default is None:
+        trusted_default = get_trusted_default(get_noscript_version(sites, StorageSyncDB))
+    elif not isinstance(trusted_default, TrustedIndex):
+        trusted_default = TrustedIndex(trusted_default)
     sites_trusted   = sites['data']['sites']['trusted']
     sites_untrusted = sites['data']['sites']['untrusted']
     sites_merged      = {}
     if len(sites_trusted) > 0:
         for site in sites_trusted:
-            if site not in sites_trusted_default:
+            site = get_site(site)
+            if site not in trusted_default:
                 sites_merged[site] = "trusted"
     if len(sites_untrusted) > 0:
         for site in sites_untrusted:
-            sites_merged[site] = "untrusted"
-    get_visited(sites_merged)
-
-
-def get_visited(sites):
-    if len(sites) == 0:
-        print '\n** NoScript TRUSTED sites **\n   Non-default permissions found: (%d)' % Counter(sites.values())["trusted"]
-        print '\n** NoScript UNTRUSTED sites **\n   Non-default permissions found: (%d)' % Counter(sites.values())["untrusted"]
-    else:
-        sites_visited_n = []
-        sites_visited_y = []
-        http_responses  = {} #dictionary to store HTTP responses
-
-        if len(sys.argv) == 3:
-            if "-r" in sys.argv:
-                if os.path.isfile(fn) == False:
-                    f = open(fn, "w")
-                    f.write("Site,TrustLevel,Visited,HttpResponse,Content-Length,ResponseURL,File\n")
-                else:
-                    f = open(fn, "a")
-                print "\nNon-default permissions found: (%d)" % len(sites)
-                print "\nSending HTTP requests to %d domains found in the file..." % len(sites)
-                for site,trust_level in sites.items():
-                    if '.onion' in site:
-                        sites_visited_y.append(site)
-                        f.write("%s,%s,possible,,,,%s\n" % (site,trust_level,StorageSyncDB))
-                    else:
-                        try:
-                            url     = "http://" + site.rstrip()
-                            hdr     = {'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; WOW64; rv:64.0) Gecko/20100101 Firefox/64.0'}
-                            req     = urllib2.Request(url)
-                            context = ssl._create_unverified_context() #avoid "SSL: CERTIFICATE_VERIFY_FAILED" error
-                            try:
-                                res = urllib2.urlopen(req, timeout=3, context=context)
-                                res_url = res.url
-                                http_responses[site]=res.read()
-                            except:
-                                try:
-                                    req = urllib2.Request(url, headers=hdr)
-                                    res = urllib2.urlopen(req, timeout=3, context=context)
-                                    res_url = res.url
-                                    http_responses[site] = res.read()
-                                except:
-                                    res_url = ""
-                                    pass
-                            if site in res_url: #if not, res.url is a redirect
-                                header = res.info().headers
-                                content_length = [header.index(i) for i in header if 'Content-Length' in i]
-                                if len(content_length) == 0: #the Content-Length field is missing
-                                    sites_visited_y.append(site)
-                                    f.write("%s,%s,possible,yes,,%s,%s\n" % (site,trust_level,res_url,StorageSyncDB))
-                                else:
-                                    content_length = content_length[0]
-                                    content_length = header[content_length]
-                                    content_length = int(content_length.replace("Content-Length: ", "").rstrip())
-                                    if content_length < 1024: #"not visited" if Content-Length is less than 1024 bytes
-                                        sites_visited_n.append(site)
-                                        f.write("%s,%s,,yes,%d,%s,%s\n" % (site,trust_level,content_length,res_url,StorageSyncDB))
-                                    else:
-                                        sites_visited_y.append(site)
-                                        f.write("%s,%s,possible,yes,%d,%s,%s\n" % (site,trust_level,content_length,res_url,StorageSyncDB))
-                            else:
-                                sites_visited_n.append(site)
-                                f.write("%s,%s,,yes,,%s,%s\n" % (site,trust_level,res_url,StorageSyncDB))
-                        except:
-                            sites_visited_n.append(site)
-                            f.write("%s,%s,,no,,,,%s\n" % (site,trust_level,StorageSyncDB))
-                f.close()
-                sites_script = []
-                for domain in sites_visited_y:
-                    for keys, values in http_responses.items():
-                        #search lines in HTML source code that load scripts
-                        regexp_list = ['<(script|iframe|wsc)?[ \.]?(type="text/javascript"|type=\'text/javascript\'|async)?[ \.\r\n]*src[a-zA-Z0-9="\'\\\./:%_-]*' + domain,
-                                       '<link rel=["|\']+(preload|prefetch|preconnect|dns-prefetch)+[a-zA-Z0-9\.="-:/ ]*' + domain]
-                        for regexp in regexp_list:
-                            m = re.search(regexp, values)
-                            if m:
-                                if keys != domain:
-                                    sites_script.append(domain)
-                sites_script    = sorted(set(sites_script))
-                sites_visited_n = sorted(set(sites_visited_n))
-                sites_visited_y = sorted(set(sites_visited_y))
-
-                if len(sites_script) > 0:
-                    for site_script in sites_script:
-                        sites_visited_n.append(site_script)
-                        sites_visited_y.remove(site_script)
-
-                    f_in      = open(fn,"r")
-                    f_in_rows = []
-                    for line in f_in:
-                        f_in_rows.append(line)
-                    f_in.close()
-
-                    f_out_rows = list(f_in_rows) #clone f_in_rows
-                    for f_in_row in f_in_rows:
-                        for site_script in sites_script:
-                            if f_in_row.startswith(site_script):
-                                f_in_newrow = f_in_row.replace("possible","")
-                                f_out_rows.remove(f_in_row)
-                                f_out_rows.append(f_in_newrow)
-                    fnt   = "temp.csv"
-                    f_out = open(fnt,"w")
-                    for f_out_row in f_out_rows:
-                        f_out.write(f_out_row)
-                    f_out.close()
-
-                    os.remove(fn)
-                    os.rename(fnt,fn)
-
-                print "\n   Based on the HTTP responses received, it's possible that:"
-                print "     ==> the user directly visited %d domain(s): " % len(sites_visited_y)
-                if len(sites_visited_y) > 0:
-                    for site_visited_y in sorted(sites_visited_y):
-                        print "      - " + site_visited_y
-                print "\n     ==> the trust level for %d domain(s) was set by the user\n     when visiting other domains:" % len(sites_visited_n)
-                if len(sites_visited_n) > 0:
-                    for site_visited_n in sorted(sites_visited_n):
-                        print "      - " + site_visited_n
-                print "\nOutput saved to: %s" % fn
+            sites_merged[get_site(site)] = "untrusted"
+    for site, trust_level in sorted(sites_merged.items()):
+        yield Permission(site, trust_level, StorageSyncDB)
 
+def get_visits(permissions, workers=probe_workers, deadline=probe_deadline, cache=None, store=None, max_body=probe_max_body,
+               resolver=None):
+    #sends the HTTP requests and returns a Visit record for each permission, sorted by site
+    #responses found in the cache (a Results_Cache.ResultsCache) are not requested again; only answers are cached
+    #with a store (Response_Store) the responses are recorded, or replayed without sending any request:
+    #the cache is then not used, so that every response goes through the store (the DNS answers still are)
+    #at most max_body bytes of each body are read, and only their Capture is kept
+    #the host names are resolved first (by resolver, default: the system resolver): the sites that don't resolve are not requested
+    s_time      = time.time()
+    permissions = sorted(permissions)
+    sites       = sorted(set(p.site for p in permissions if '.onion' not in p.site))
+    probes      = {}
+    dns_cache   = cache
+    if store is not None:
+        cache = None
+    if cache is not None:
+        for site in sites:
+            probe = cache.get('probe|%d|%d|%s' % (Results_Cache.cache_version, max_body, site))
+            if probe is not None:
+                probes[site] = probe[:2] + (Capture(*probe[2]),)
+    Metrics.count("noscript.cached_probes", len(probes))
+    pending = [site for site in sites if site not in probes]
+    if store is None or store.record:
+        with Metrics.timer("noscript.dns"):
+            resolved = get_resolved([get_hostname(site) for site in pending], deadline, dns_cache, resolver)
+        unresolved = [site for site in pending if resolved.get(get_hostname(site)) == []]
+        Metrics.count("noscript.unresolved", len(unresolved))
+        for site in unresolved:
+            probes[site] = ("", None, None)
+        pending = [site for site in pending if site not in probes]
+    with Metrics.timer("noscript.probe"):
+        probed = get_probes(pending, workers, max(0, deadline - (time.time() - s_time)), store, max_body)
+    if cache is not None:
+        for site, probe in probed.items():
+            if probe[0] == "": #no answer (deadline, timeout, network error): the site is requested again in the next run
+                continue
+            #the Capture is saved as a plain tuple: a namedtuple is pickled with its module ('__main__' when run as a script)
+            cache.put('probe|%d|%d|%s' % (Results_Cache.cache_version, max_body, site), probe[:2] + (tuple(probe[2]),),
+                      Results_Cache.probe_ttl)
+    probes.update(probed)
+    visits      = []
+    http_responses  = {} #URLs of the resources loaded by each site
+    sites_visited_y = set()
+    for site,trust_level,StorageSyncDB in permissions:
+        if '.onion' in site:
+            sites_visited_y.add(site)
+            visits.append(Visit(site,trust_level,"possible","","","","",StorageSyncDB))
+            continue
+        res_url, content_length, capture = probes[site]
+        if res_url == "":
+            visits.append(Visit(site,trust_level,"","no","","","",StorageSyncDB))
+            continue
+        http_responses[site] = capture.references
+        if get_host(site) in res_url: #if not, res_url is a redirect
+            if content_length is None: #the Content-Length field is missing
+                sites_visited_y.add(site)
+                visits.append(Visit(site,trust_level,"possible","yes","",res_url,capture.sha256,StorageSyncDB))
+            elif content_length < 1024: #"not visited" if Content-Length is less than 1024 bytes
+                visits.append(Visit(site,trust_level,"","yes",str(content_length),res_url,capture.sha256,StorageSyncDB))
+            else:
+                sites_visited_y.add(site)
+                visits.append(Visit(site,trust_level,"possible","yes",str(content_length),res_url,capture.sha256,StorageSyncDB))
         else:
-            print '\n** NoScript TRUSTED sites **\n   Non-default permissions found: (%d)' % Counter(sites.values())["trusted"]
-            if Counter(sites.values())["trusted"]:
-                for site, trust_level in sorted(sites.items()):
-                    if trust_level == "trusted":
-                        print "   - " + site
-            print '\n** NoScript UNTRUSTED sites **\n   Non-default permissions found: (%d)' % Counter(sites.values())["untrusted"]
-            if Counter(sites.values())["untrusted"] > 0:
-                for site,trust_level in sorted(sites.items()):
-                    if trust_level == "untrusted":
-                        print "   - " + site
+            visits.append(Visit(site,trust_level,"","yes","",res_url,capture.sha256,StorageSyncDB))
+    sites_script = set()
+    if len(sites_visited_y) > 0:
+        with Metrics.timer("noscript.regex"):
+            trie         = get_trie(sites_visited_y)
+            domain_regex = re.compile("(?=(%s))" % get_trie_regex(trie))
+            for keys, values in sorted(http_responses.items()):
+                for domain in get_included(values, domain_regex, trie):
+                    if keys != domain:
+                        sites_script.add(domain)
+    #domains loaded by other sites were not directly visited
+    return [visit._replace(visited="") if visit.site in sites_script else visit for visit in visits]
 
+def get_sites(StorageSyncDB, writer=None, probe=False, workers=probe_workers, deadline=probe_deadline, cache=None, wal=False, store=None,
+              max_body=probe_max_body, resolver=None):
+    #with probe, the Visit records are written with writer (an Output_Writers writer opened once for all the profiles)
+    permissions = list(get_permissions(StorageSyncDB, wal=wal))
+    get_version()
+    print '\nAnalyzing file: %s ...' % StorageSyncDB
+    if wal == False and os.path.isfile(StorageSyncDB + "-wal") and os.path.getsize(StorageSyncDB + "-wal") > 0:
+        print '\nWarning - The file %s-wal may contain more recent records (use --wal to read them)' % os.path.basename(StorageSyncDB)
+    if probe and len(permissions) > 0:
+        get_visited(permissions, writer, workers, deadline, cache, store, max_body, resolver)
+    else:
+        trust_levels = Counter(permission.trust_level for permission in permissions)
+        print '\n** NoScript TRUSTED sites **\n   Non-default permissions found: (%d)' % trust_levels["trusted"]
+        for permission in permissions:
+            if permission.trust_level == "trusted":
+                print "   - " + get_text(permission.site)
+        print '\n** NoScript UNTRUSTED sites **\n   Non-default permissions found: (%d)' % trust_levels["untrusted"]
+        for permission in permissions:
+            if permission.trust_level == "untrusted":
+                print "   - " + get_text(permission.site)
 
-#start
-# From NoScript v10.2.1: default list of trusted sites
-# (From NoScript v10.2.1: default list of untrusted sites is empty)
-sites_trusted_default = "addons.mozilla.org", "afx.ms", "ajax.aspnetcdn.com", "ajax.googleapis.com", "bootstrapcdn.com", "code.jquery.com", "firstdata.com", "firstdata.lv", "gfx.ms", "google.com", "googlevideo.com", "gstatic.com", "hotmail.com", "live.com", "live.net", "maps.googleapis.com", "mozilla.net", "netflix.com", "nflxext.com", "nflximg.com", "nflxvideo.net", "noscript.net", "outlook.com", "passport.com", "passport.net", "passportimages.com", "paypal.com", "paypalobjects.com", "securecode.com", "securesuite.net", "sfx.ms", "tinymce.cachefly.net", "wlxrs.com", "yahoo.com", "yahooapis.com", "yimg.com", "youtube.com", "ytimg.com"
+def get_visited(permissions, writer, workers, deadline, cache, store=None, max_body=probe_max_body, resolver=None):
+    print "\nNon-default permissions found: (%d)" % len(permissions)
+    if store is not None and not store.record:
+        print "\nReading the HTTP responses of %d domains found in the file from %s..." % (len(permissions), store.path)
+    else:
+        print "\nSending HTTP requests to %d domains found in the file..." % len(permissions)
+    visits = get_visits(permissions, workers, deadline, cache, store, max_body, resolver)
+    with Metrics.timer("output.write"):
+        writer.write_rows(visits)
+    sites_visited_y = [visit.site for visit in visits if visit.visited == "possible"]
+    sites_visited_n = [visit.site for visit in visits if visit.visited != "possible"]
+    print "\n   Based on the HTTP responses received, it's possible that:"
+    print "     ==> the user directly visited %d domain(s): " % len(sites_visited_y)
+    if len(sites_visited_y) > 0:
+        for site_visited_y in sorted(sites_visited_y):
+            print "      - " + get_text(site_visited_y)
+    print "\n     ==> the trust level for %d domain(s) was set by the user\n     when visiting other domains:" % len(sites_visited_n)
+    if len(sites_visited_n) > 0:
+        for site_visited_n in sorted(sites_visited_n):
+            print "      - " + get_text(site_visited_n)
+    if cache is not None:
+        print "\n%s" % cache.get_summary()
+    if store is not None:
+        print "\n%s" % store.get_summary()
 
-if len(sys.argv) > 1:
-    s_time = datetime.now()  # script starting time
-    p_time = s_time.strftime('%Y%m%d_%H%M%S')  # prefix time
-    fn     = p_time + "_NoScript.csv"  # output file
-    if '--default-path' in sys.argv:
-        myOS     = platform.system()
-        username = getpass.getuser()
-        if myOS == 'Windows':
-            firefox_profile = 'C:/Users/' + username + '/AppData/Roaming/Mozilla/Firefox/Profiles'
-        if myOS == 'Linux':
-            firefox_profile = '/home/' + username + '/.mozilla/firefox'
-        if myOS == 'Darwin':
-            firefox_profile = '/Users/' + username + '/Library/Application Support/Firefox/Profiles'
+def main(argv):
+    argv, fn, format = Output_Writers.get_output_args(argv, "NoScript")
+    argv, metrics_fn = Metrics.get_metrics_args(argv)
+    if len(argv) > 1:
+        probe    = '-r' in argv
+        workers  = get_option(argv, '--workers', probe_workers)
+        deadline = get_option(argv, '--deadline', probe_deadline)
+        max_body = get_option(argv, '--max-body', probe_max_body)
+        wal      = '--wal' in argv
+        cache    = None
+        store    = None
+        resolver = None
+        if '--cache' in argv and argv.index('--cache') + 1 < len(argv):
+            cache = Results_Cache.ResultsCache(argv[argv.index('--cache') + 1])
+        if '--trusted-default' in argv and argv.index('--trusted-default') + 1 < len(argv):
+            add_trusted_defaults(argv[argv.index('--trusted-default') + 1])
+        if '--hosts' in argv and argv.index('--hosts') + 1 < len(argv):
+            resolver = get_hosts_resolver(argv[argv.index('--hosts') + 1])
+        if '--replay' in argv and argv.index('--replay') + 1 < len(argv):
+            probe = True
+            store = Response_Store.get_store(argv[argv.index('--replay') + 1])
+        elif '--record' in argv and argv.index('--record') + 1 < len(argv):
+            store = Response_Store.get_store(argv[argv.index('--record') + 1], record=True)
+        writer = None
+        if probe:
+            #one writer for the whole run: the rows of all the profiles are appended to the output file, renamed once at the end
+            writer = Output_Writers.get_writer(fn, visit_header, format, append=True)
         try:
-            firefox_dirs = os.listdir(firefox_profile)
-        except:
-            print "The following path %s was not found.\n" % firefox_profile
-            sys.exit()
-        try:
-            for firefox_dir in firefox_dirs:
-                if '.default' in firefox_dir:
-                    StorageSyncDB = firefox_profile + '/' + firefox_dir + '/storage-sync.sqlite'
-                    get_sites(StorageSyncDB)
-        except:
-            print '\nError - The following file was not found:\n%s\n' % StorageSyncDB
-    elif 'storage-sync.sqlite' in str(sys.argv):
-        for arg in sys.argv:
-            if 'storage-sync.sqlite' in arg:
-                StorageSyncDB = os.path.abspath(arg)
-                get_sites(StorageSyncDB)
+            if '--default-path' in argv:
+                myOS     = platform.system()
+                username = getpass.getuser()
+                if myOS == 'Windows':
+                    firefox_profile = 'C:/Users/' + username + '/AppData/Roaming/Mozilla/Firefox/Profiles'
+                if myOS == 'Linux':
+                    firefox_profile = '/home/' + username + '/.mozilla/firefox'
+                if myOS == 'Darwin':
+                    firefox_profile = '/Users/' + username + '/Library/Application Support/Firefox/Profiles'
+                try:
+                    firefox_dirs = os.listdir(firefox_profile)
+                except:
+                    print "The following path %s was not found.\n" % firefox_profile
+                    firefox_dirs = []
+                try:
+                    for firefox_dir in firefox_dirs:
+                        if '.default' in firefox_dir:
+                            StorageSyncDB = firefox_profile + '/' + firefox_dir + '/storage-sync.sqlite'
+                            get_sites(StorageSyncDB, writer, probe, workers, deadline, cache, wal, store, max_body, resolver)
+                except:
+                    print '\nError - The following file was not found:\n%s\n' % StorageSyncDB
+            elif 'storage-sync.sqlite' in str(argv):
+                for arg in argv:
+                    if 'storage-sync.sqlite' in arg:
+                        StorageSyncDB = os.path.abspath(arg)
+                        get_sites(StorageSyncDB, writer, probe, workers, deadline, cache, wal, store, max_body, resolver)
+            else:
+                get_help()
+        finally:
+            if cache is not None:
+                cache.close()
+            if store is not None:
+                store.close()
+            if writer is not None:
+                with Metrics.timer("output.write"):
+                    writer.close()
+                print "\nOutput saved to: %s" % fn
+            Metrics.write_summary(metrics_fn)
     else:
         get_help()
-else:
-    get_help()
 
+#start
+if __name__ == '__main__':
+    main(sys.argv)
\ No newline at end of file
@@ -0,0 +1,173 @@
+'''
+*********************************** LICENSE ***********************************
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You can view the GNU General Public License at <http://www.gnu.org/licenses/>
+*******************************************************************************
+
+Metrics - WARNING: This program is provided "as-is"
+
+Author    : Gabriele Zambelli (Twitter: @gazambelli)
+Blog      : http://forensenellanebbia.blogspot.it
+Version   : 20261018
+
+Optional timers and counters of Firefox_NoScript.py, Firefox_AdblockPlus.py and VLC_LastPlayedPosition.py
+(option --metrics FILE): at exit, FILE contains a JSON summary of
+ - phases  : calls, total/min/max seconds of each phase (e.g. noscript.sqlite, noscript.json, probe.dns,
+             probe.connect, probe.request, probe.body, noscript.regex, vlc.parse, abp.parse, output.write)
+ - counters: e.g. size of the artifacts (*.file_size: the memory-mapped, indexed and SQLite readers may read less),
+             bytes downloaded, HTTP requests, cache hits
+ - latency : a histogram of the HTTP request latency of each host: counts[n] is the number of requests that took
+             up to buckets_ms[n] milliseconds (the last count is for the slower ones)
+Without --metrics nothing is recorded: timer() returns a shared object that does nothing and count()/observe()
+return at once, so the scripts run as fast as before.
+
+Requirements:
+ - Python 2.7
+'''
+
+from datetime import datetime
+import json
+import os
+import threading
+import time
+
+latency_buckets = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000) # milliseconds
+
+metrics = None # the Metrics object, once enabled
+
+class NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+null_timer = NullTimer()
+
+class Timer(object):
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name    = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.add_time(self.name, time.time() - self.start)
+        return False
+
+class Metrics(object):
+
+    def __init__(self, script):
+        self.script   = script
+        self.started  = time.time()
+        self.lock     = threading.Lock()
+        self.phases   = {} # name -> [calls, seconds, min, max]
+        self.counters = {}
+        self.latency  = {} # host -> [count of each bucket (the last one is over the last limit), count, seconds, min, max]
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            phase = self.phases.get(name)
+            if phase is None:
+                self.phases[name] = [1, seconds, seconds, seconds]
+            else:
+                phase[0] += 1
+                phase[1] += seconds
+                phase[2]  = min(phase[2], seconds)
+                phase[3]  = max(phase[3], seconds)
+
+    def add_count(self, name, value):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_latency(self, host, seconds):
+        milliseconds = seconds * 1000
+        bucket       = len(latency_buckets)
+        for n, limit in enumerate(latency_buckets):
+            if milliseconds <= limit:
+                bucket = n
+                break
+        with self.lock:
+            histogram = self.latency.get(host)
+            if histogram is None:
+                histogram = self.latency[host] = [[0] * (len(latency_buckets) + 1), 0, 0.0, seconds, seconds]
+            histogram[0][bucket] += 1
+            histogram[1] += 1
+            histogram[2] += seconds
+            histogram[3]  = min(histogram[3], seconds)
+            histogram[4]  = max(histogram[4], seconds)
+
+    def get_summary(self):
+        with self.lock:
+            return {
+                "script"  : self.script,
+                "started" : datetime.utcfromtimestamp(self.started).strftime('%Y-%m-%d %H:%M:%S'),
+                "seconds" : round(time.time() - self.started, 6),
+                "phases"  : dict((name, {"calls": calls, "seconds": round(total, 6), "min": round(low, 6), "max": round(high, 6)})
+                                 for name, (calls, total, low, high) in self.phases.items()),
+                "counters": dict(self.counters),
+                "latency" : dict((host, {"buckets_ms": list(latency_buckets), "counts": buckets, "count": count, "seconds": round(total, 6),
+                                         "min": round(low, 6), "max": round(high, 6)})
+                                 for host, (buckets, count, total, low, high) in self.latency.items())}
+
+#functions used by the scripts
+def enable(script):
+    global metrics
+    metrics = Metrics(script)
+    return metrics
+
+def timer(name):
+    if metrics is None:
+        return null_timer
+    return Timer(metrics, name)
+
+def count(name, value=1):
+    if metrics is not None:
+        metrics.add_count(name, value)
+
+def observe(host, seconds):
+    if metrics is not None:
+        metrics.add_latency(host, seconds)
+
+def count_file(name, path):
+    #adds the size of a file (or of the files of a folder) to the counter name
+    if metrics is None:
+        return
+    try:
+        if os.path.isdir(path):
+            metrics.add_count(name, sum(os.path.getsize(os.path.join(path, item)) for item in os.listdir(path)))
+        else:
+            metrics.add_count(name, os.path.getsize(path))
+    except OSError:
+        pass
+
+def get_metrics_args(argv):
+    #removes --metrics FILE from argv, enables the metrics and returns (argv, summary file or None)
+    argv = list(argv)
+    if '--metrics' in argv and argv.index('--metrics') + 1 < len(argv):
+        n  = argv.index('--metrics')
+        fn = argv[n + 1]
+        del argv[n:n + 2]
+        enable(os.path.basename(argv[0]))
+        return argv, fn
+    return argv, None
+
+def write_summary(fn):
+    if metrics is None or fn is None:
+        return
+    with open(fn, "wb") as f:
+        json.dump(metrics.get_summary(), f, indent=1, sort_keys=True)
+    print "\nMetrics saved to: %s" % fn
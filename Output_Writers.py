@@ -0,0 +1,271 @@
+'''
+*********************************** LICENSE ***********************************
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You can view the GNU General Public License at <http://www.gnu.org/licenses/>
+*******************************************************************************
+
+Output_Writers - WARNING: This program is provided "as-is"
+
+Author    : Gabriele Zambelli (Twitter: @gazambelli)
+Blog      : http://forensenellanebbia.blogspot.it
+Version   : 20261018
+
+Output formats shared by the scripts of this repository (options --output FILE and --format FORMAT):
+ - csv      : RFC 4180 CSV, UTF-8, values containing commas, quotes or new lines are quoted
+ - jsonl    : JSON Lines, one object per row keyed by the column names
+ - columnar : compact column-oriented file. Each column is stored as a zlib-compressed list of its distinct
+              values followed by a zlib-compressed array of indices into that list; a JSON footer (whose offset
+              is in the last 8 bytes of the file) lists the columns, so that get_columnar can read only the
+              columns it needs
+
+Rows are written in batches through a large buffer to a temporary file in the same folder as the output,
+which replaces the output file when the writer is closed: an interrupted run never leaves a truncated file.
+With append=True the rows of the existing output file are kept (e.g. several Firefox profiles in one run).
+
+Requirements:
+ - Python 2.7
+'''
+
+from collections import OrderedDict
+from datetime import datetime
+import array
+import csv
+import json
+import os
+import struct
+import sys
+import tempfile
+import zlib
+
+buffer_size    = 1024 * 1024 # bytes buffered before each write to disk
+batch_size     = 4096        # rows formatted at once
+columnar_magic = "PYCOL01\n"
+
+def get_value(value):
+    #unicode text of a value (None is kept)
+    #byte strings that are not UTF-8 (e.g. paths with a Latin-1 user folder) are decoded as Latin-1: no byte is lost,
+    #value.encode('latin-1') gives back the original bytes
+    if value is None or isinstance(value, unicode):
+        return value
+    if isinstance(value, str):
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            return value.decode('latin-1')
+    return unicode(value)
+
+def get_batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+class OutputWriter(object):
+    #writes the rows to a temporary file that replaces fn when the writer is closed
+
+    extension = ''
+
+    def __init__(self, fn, header, append=False):
+        self.fn     = fn
+        self.header = [get_value(name) for name in header]
+        self.rows   = 0
+        fn_dir      = os.path.dirname(os.path.abspath(fn))
+        fd, self.fn_tmp = tempfile.mkstemp(prefix=".%s." % os.path.basename(fn), suffix=".tmp", dir=fn_dir)
+        self.f      = os.fdopen(fd, "wb", buffer_size)
+        umask       = os.umask(0)
+        os.umask(umask)
+        os.chmod(self.fn_tmp, 0666 & ~umask) #mkstemp creates the file readable by its owner only
+        try:
+            self.start(append and os.path.isfile(fn))
+        except:
+            self.discard()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def start(self, append):
+        #copies the existing output file, or writes the header
+        if append:
+            with open(self.fn, "rb") as f_in:
+                while True:
+                    data = f_in.read(buffer_size)
+                    if not data:
+                        break
+                    self.f.write(data)
+        else:
+            self.write_header()
+
+    def write_header(self):
+        pass
+
+    def write_rows(self, rows):
+        for batch in get_batches(rows):
+            self.write_batch([[get_value(value) for value in row] for row in batch])
+            self.rows += len(batch)
+
+    def write_row(self, row):
+        self.write_rows([row])
+
+    def finish(self):
+        pass
+
+    def close(self):
+        try:
+            self.finish()
+            self.f.close()
+            if os.name == "nt" and os.path.isfile(self.fn): #os.rename doesn't overwrite on Windows
+                os.remove(self.fn)
+            os.rename(self.fn_tmp, self.fn)
+        except:
+            self.discard()
+            raise
+
+    def discard(self):
+        self.f.close()
+        if os.path.isfile(self.fn_tmp):
+            os.remove(self.fn_tmp)
+
+class CsvWriter(OutputWriter):
+
+    extension = '.csv'
+
+    def start(self, append):
+        self.writer = csv.writer(self.f)
+        OutputWriter.start(self, append)
+
+    def write_header(self):
+        self.writer.writerow([name.encode('utf-8') for name in self.header])
+
+    def write_batch(self, rows):
+        self.writer.writerows([[value.encode('utf-8') if value is not None else '' for value in row] for row in rows])
+
+class JsonLinesWriter(OutputWriter):
+
+    extension = '.jsonl'
+
+    def write_batch(self, rows):
+        lines = [json.dumps(OrderedDict(zip(self.header, row)), ensure_ascii=False).encode('utf-8') for row in rows]
+        self.f.write("\n".join(lines) + "\n")
+
+class ColumnarWriter(OutputWriter):
+
+    extension = '.col'
+
+    def start(self, append):
+        #distinct values and indices of each column, kept in memory until the writer is closed
+        self.values  = [[] for name in self.header]
+        self.ids     = [{} for name in self.header]
+        self.indices = [array.array('I') for name in self.header]
+        if append:
+            columns = get_columnar(self.fn)
+            if [column for column, values in columns] != self.header:
+                raise ValueError("the columns of %s are different" % self.fn)
+            self.write_rows(zip(*[values for column, values in columns]))
+
+    def write_batch(self, rows):
+        for n in range(len(self.header)):
+            values, ids, indices = self.values[n], self.ids[n], self.indices[n]
+            for row in rows:
+                value = row[n]
+                if value not in ids:
+                    ids[value] = len(values)
+                    values.append(value)
+                indices.append(ids[value])
+
+    def finish(self):
+        self.f.write(columnar_magic)
+        offset  = len(columnar_magic)
+        columns = []
+        for name, values, indices in zip(self.header, self.values, self.indices):
+            if sys.byteorder != 'little':
+                indices.byteswap()
+            blocks = [zlib.compress(json.dumps(values, ensure_ascii=False).encode('utf-8')), zlib.compress(indices.tostring())]
+            column = {"name": name}
+            for key, block in zip(("values", "indices"), blocks):
+                column[key] = [offset, len(block)]
+                self.f.write(block)
+                offset += len(block)
+            columns.append(column)
+        footer = json.dumps({"rows": self.rows, "columns": columns}, ensure_ascii=False).encode('utf-8')
+        self.f.write(footer)
+        self.f.write(struct.pack("<Q", offset))
+
+def get_columnar(fn, names=None):
+    #returns [(column name, list of values)] reading only the columns in names (default: all of them)
+    with open(fn, "rb") as f:
+        if f.read(len(columnar_magic)) != columnar_magic:
+            raise ValueError("%s is not a columnar file" % fn)
+        f.seek(-8, os.SEEK_END)
+        end    = f.tell()
+        offset = struct.unpack("<Q", f.read(8))[0]
+        f.seek(offset)
+        footer = json.loads(f.read(end - offset).decode('utf-8'))
+        result = []
+        for column in footer["columns"]:
+            if names is not None and column["name"] not in names:
+                continue
+            f.seek(column["values"][0])
+            values  = json.loads(zlib.decompress(f.read(column["values"][1])).decode('utf-8'))
+            f.seek(column["indices"][0])
+            indices = array.array('I')
+            indices.fromstring(zlib.decompress(f.read(column["indices"][1])))
+            if sys.byteorder != 'little':
+                indices.byteswap()
+            result.append((column["name"], [values[index] for index in indices]))
+    return result
+
+formats = {'csv': CsvWriter, 'jsonl': JsonLinesWriter, 'columnar': ColumnarWriter}
+
+def get_format(fn, format=None):
+    #the format is chosen by --format or by the extension of the output file (default: csv)
+    if format is not None:
+        return format
+    for name, writer in formats.items():
+        if fn.lower().endswith(writer.extension):
+            return name
+    return 'csv'
+
+def get_writer(fn, header, format=None, append=False):
+    return formats[get_format(fn, format)](fn, header, append)
+
+def get_output_args(argv, suffix):
+    #removes --output FILE and --format FORMAT from argv and returns (argv, output file, format)
+    #the default output file is <date>_<time>_<suffix> with the extension of the format
+    argv   = list(argv)
+    fn     = None
+    format = None
+    for option in ('--output', '--format'):
+        if option in argv and argv.index(option) + 1 < len(argv):
+            n     = argv.index(option)
+            value = argv[n + 1]
+            del argv[n:n + 2]
+            if option == '--output':
+                fn = value
+            elif value in formats:
+                format = value
+            else:
+                print "\nUnknown output format: %s (%s)" % (value, ", ".join(sorted(formats)))
+    if fn is None:
+        p_time = datetime.now().strftime('%Y%m%d_%H%M%S')  # prefix time
+        fn     = p_time + "_" + suffix + formats[format or 'csv'].extension
+    return argv, fn, get_format(fn, format)
@@ -0,0 +1,307 @@
+'''
+*********************************** LICENSE ***********************************
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You can view the GNU General Public License at <http://www.gnu.org/licenses/>
+*******************************************************************************
+
+Response_Store - WARNING: This program is provided "as-is"
+
+Author    : Gabriele Zambelli (Twitter: @gazambelli)
+Blog      : http://forensenellanebbia.blogspot.it
+Version   : 20261018
+
+HTTP responses used by Firefox_NoScript.py -r, so that the sites can be classified offline (e.g. in a lab
+without Internet access) and the classification can be repeated without sending the requests again.
+ - --record FILE : the responses (status, headers, URL and body of every request, redirects included) are saved
+                   to FILE, a ZIP archive with one compressed entry per URL
+ - --replay PATH : no request is sent, the responses are read from PATH: an archive written by --record, or a
+                   folder of WARC files (.warc or .warc.gz, e.g. written by wget --warc-file) whose 'response'
+                   records are indexed by their WARC-Target-URI
+A URL missing from the store is handled as a site that didn't answer.
+
+Requirements:
+ - Python 2.7
+'''
+
+from collections import namedtuple
+import hashlib
+import json
+import os
+import StringIO
+import tempfile
+import threading
+import urlparse
+import warnings
+import zipfile
+import zlib
+
+gzip_chunk = 64 * 1024
+
+# headers is a list of (lowercase name, value)
+Response = namedtuple('Response', 'url status headers body')
+
+def get_key(url):
+    #http://Example.com -> http://example.com/ (the fragment is not sent to the server)
+    url_parts = urlparse.urlsplit(url.strip())
+    return urlparse.urlunsplit((url_parts.scheme.lower(), url_parts.netloc.lower(), url_parts.path or "/", url_parts.query, ""))
+
+def get_header(response, name):
+    for header, value in response.headers:
+        if header == name:
+            return value
+    return None
+
+def get_temp_path(path):
+    #empty temporary file next to path (renamed to path when the archive is closed), with the mode of a new file
+    fd, path_tmp = tempfile.mkstemp(prefix=".%s." % os.path.basename(path), suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(path_tmp, 0666 & ~umask) #mkstemp creates the file readable by its owner only
+    return path_tmp
+
+class ArchiveStore(object):
+    #ZIP archive: one entry per URL named by the SHA-1 of the URL, a JSON line (url, status, headers) followed by the body
+
+    def __init__(self, path, record=False):
+        self.path   = path
+        self.record = record
+        self.lock   = threading.Lock()
+        self.names  = set()
+        self.copies = 0  # entries written more than once (e.g. the retry with a User-Agent header)
+        if record:
+            self.path_tmp = get_temp_path(path)
+            self.archive = zipfile.ZipFile(self.path_tmp, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+        else:
+            self.archive = zipfile.ZipFile(path, "r", allowZip64=True)
+            self.names   = set(self.archive.namelist())
+
+    def get_name(self, url):
+        key = get_key(url)
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return hashlib.sha1(key).hexdigest()
+
+    def get(self, url):
+        name = self.get_name(url)
+        with self.lock:
+            if name not in self.names or self.record: #the archive being recorded can't be read
+                return None
+            data = self.archive.read(name)
+        header, body = data.split("\n", 1)
+        header = json.loads(header)
+        return Response(header["url"], header["status"], [tuple(item) for item in header["headers"]], body)
+
+    def put(self, response):
+        name   = self.get_name(response.url)
+        header = json.dumps({"url": response.url, "status": response.status, "headers": response.headers})
+        with self.lock:
+            #each response is written at once, so that memory doesn't grow with the number of sites
+            if name in self.names:
+                self.copies += 1
+            self.names.add(name)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore") #"Duplicate name": the copy is removed by close
+                self.archive.writestr(name, header + "\n" + response.body)
+
+    def close(self):
+        if not self.record:
+            self.archive.close()
+            return
+        try:
+            self.archive.close()
+            if self.copies > 0 or os.path.isfile(self.path):
+                self.merge()
+            if os.name == "nt" and os.path.isfile(self.path): #os.rename doesn't overwrite on Windows
+                os.remove(self.path)
+            os.rename(self.path_tmp, self.path)
+        finally:
+            if os.path.isfile(self.path_tmp):
+                os.remove(self.path_tmp)
+
+    def merge(self):
+        #copies the archive entry by entry: a later response to the same URL replaces the previous one, and the
+        #responses of a previous --record to the same file are kept, unless they were requested again
+        path_merged = get_temp_path(self.path)
+        try:
+            with zipfile.ZipFile(self.path_tmp, "r", allowZip64=True) as current:
+                with zipfile.ZipFile(path_merged, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+                    latest = dict((info.filename, info) for info in current.infolist())
+                    for name in sorted(latest):
+                        archive.writestr(name, current.read(latest[name]))
+                    if os.path.isfile(self.path):
+                        with zipfile.ZipFile(self.path, "r", allowZip64=True) as previous:
+                            for name in previous.namelist():
+                                if name not in self.names:
+                                    archive.writestr(name, previous.read(name))
+            os.remove(self.path_tmp)
+        except:
+            os.remove(path_merged)
+            raise
+        self.path_tmp = path_merged
+
+    def get_summary(self):
+        return "Response store: %d response(s) (%s)" % (len(self.names), self.path)
+
+class WarcStore(object):
+    #read-only: the 'response' records of the .warc/.warc.gz files of a folder, indexed by WARC-Target-URI
+
+    def __init__(self, path):
+        self.path    = path
+        self.record  = False
+        self.lock    = threading.Lock()
+        #URL -> (file, offset of the gzip member or None, offset and length of the record block); the last record of a URL wins
+        self.records = {}
+        for dirpath, dirnames, filenames in os.walk(path):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(('.warc', '.warc.gz')):
+                    fn = os.path.join(dirpath, filename)
+                    for headers, member, offset, length in get_warc_records(fn):
+                        if headers.get('warc-type') == 'response' and 'warc-target-uri' in headers:
+                            self.records[get_key(headers['warc-target-uri'].strip('<>'))] = (fn, member, offset, length)
+
+    def get(self, url):
+        key = get_key(url)
+        if key not in self.records:
+            return None
+        fn, member, offset, length = self.records[key]
+        with open(fn, 'rb') as f:
+            if member is None:
+                f.seek(offset)
+                block = f.read(length)
+            else: #only the gzip member of the record is decompressed
+                f.seek(member)
+                block = get_member_data(f, offset + length)[offset:offset + length]
+        return get_http_response(url, block)
+
+    def put(self, response):
+        raise IOError("%s is read-only" % self.path)
+
+    def close(self):
+        pass
+
+    def get_summary(self):
+        return "Response store: %d response(s) (%s)" % (len(self.records), self.path)
+
+def get_warc_records(fn):
+    #yields (WARC headers with lowercase names, offset of the gzip member or None, offset of the block, length of the block)
+    #a .warc.gz file is a sequence of gzip members, usually one per record: the offsets of a block are within its member
+    if not fn.lower().endswith('.gz'):
+        with open(fn, 'rb') as f:
+            for headers, offset, length in get_blocks(fn, f):
+                yield headers, None, offset, length
+        return
+    for member, data in get_gzip_members(fn):
+        for headers, offset, length in get_blocks(fn, StringIO.StringIO(data)):
+            yield headers, member, offset, length
+
+def get_blocks(fn, f):
+    while True:
+        line = f.readline()
+        if not line:
+            return
+        if not line.strip():
+            continue
+        if not line.startswith('WARC/'):
+            raise ValueError("%s: invalid WARC record at offset %d" % (fn, f.tell() - len(line)))
+        headers = {}
+        for line in iter(f.readline, ''):
+            if not line.strip():
+                break
+            name, sep, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        offset = f.tell()
+        f.seek(length, os.SEEK_CUR)
+        yield headers, offset, length
+
+def get_gzip_members(fn):
+    #yields (offset of the member in the compressed file, decompressed data of the member)
+    with open(fn, 'rb') as f:
+        pending = ''
+        offset  = 0
+        while True:
+            if not pending:
+                pending = f.read(gzip_chunk)
+                if not pending:
+                    return
+            start  = offset
+            member = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            chunks = []
+            while True:
+                chunks.append(member.decompress(pending))
+                if member.unused_data: #the input after the end of the member belongs to the next one
+                    offset += len(pending) - len(member.unused_data)
+                    pending = member.unused_data
+                    break
+                offset += len(pending)
+                pending = f.read(gzip_chunk)
+                if not pending:
+                    break
+            chunks.append(member.flush())
+            yield start, "".join(chunks)
+
+def get_member_data(f, size):
+    #decompresses the first size bytes of the gzip member at the position of f
+    member = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunks = []
+    total  = 0
+    while total < size and not member.unused_data:
+        data = f.read(gzip_chunk)
+        if not data:
+            break
+        chunk  = member.decompress(data)
+        total += len(chunk)
+        chunks.append(chunk)
+    return "".join(chunks)
+
+def get_http_response(url, block):
+    #HTTP response as saved in a WARC 'response' record: status line, headers, body (as sent by the server)
+    head, sep, body = block.partition("\r\n\r\n")
+    if not sep:
+        head, sep, body = block.partition("\n\n")
+    lines   = head.splitlines()
+    status  = int(lines[0].split()[1])
+    headers = []
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        headers.append((name.strip().lower(), value.strip()))
+    response = Response(url, status, headers, body)
+    if (get_header(response, 'transfer-encoding') or '').lower() == 'chunked':
+        body = get_dechunked(body)
+    if (get_header(response, 'content-encoding') or '').lower() in ('gzip', 'x-gzip', 'deflate'):
+        try:
+            body = zlib.decompress(body, 32 + zlib.MAX_WBITS) #gzip or zlib header
+        except zlib.error:
+            pass
+    return response._replace(body=body)
+
+def get_dechunked(body):
+    chunks = []
+    pos    = 0
+    while pos < len(body):
+        end = body.find("\r\n", pos)
+        if end == -1:
+            break
+        size = int(body[pos:end].split(';')[0].strip() or '0', 16)
+        if size == 0:
+            break
+        chunks.append(body[end + 2:end + 2 + size])
+        pos = end + 2 + size + 2
+    return "".join(chunks)
+
+def get_store(path, record=False):
+    if record:
+        return ArchiveStore(path, record=True)
+    if os.path.isdir(path):
+        return WarcStore(path)
+    return ArchiveStore(path)
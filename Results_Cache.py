@@ -0,0 +1,109 @@
+'''
+*********************************** LICENSE ***********************************
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You can view the GNU General Public License at <http://www.gnu.org/licenses/>
+*******************************************************************************
+
+Results_Cache - WARNING: This program is provided "as-is"
+
+Author    : Gabriele Zambelli (Twitter: @gazambelli)
+Blog      : http://forensenellanebbia.blogspot.it
+Version   : 20261018
+
+On-disk cache (a SQLite file) shared by Batch_Artifacts.py and Firefox_NoScript.py, so that re-running them
+against the same evidence doesn't parse unchanged files or send the same HTTP requests again.
+ - parsed files are keyed by (path, size, modification time): a modified file is parsed again
+ - every entry expires after a TTL
+ - the DNS answers of Firefox_NoScript.py -r are kept too: the hosts that don't resolve for a shorter time
+ - when the cache grows over its maximum size, the least recently used entries are removed
+The cache file is written next to the output, never next to the evidence.
+
+Requirements:
+ - Python 2.7
+'''
+
+import cPickle
+import os
+import sqlite3
+import time
+
+cache_version = 3                    # bump when the format of the cached records changes
+file_ttl      = 30 * 24 * 3600       # seconds a parsed file is kept
+probe_ttl     = 24 * 3600            # seconds a HTTP response is kept
+dns_ttl       = 6 * 3600             # seconds the addresses of a host are kept
+dns_negative_ttl = 3600              # seconds a host that doesn't resolve is kept
+cache_size    = 256 * 1024 * 1024    # maximum size (bytes) of the cached values
+
+def get_file_key(kind, path):
+    #e.g. NoScript|1|/mnt/image/.../storage-sync.sqlite|98304|1548633600
+    #a folder (e.g. a LevelDB) is keyed by the number, total size and latest modification time of its files
+    if os.path.isdir(path):
+        stats = [os.stat(os.path.join(path, name)) for name in sorted(os.listdir(path))]
+        key   = '%s|%d|%s|%d|%d|%d' % (kind, cache_version, os.path.abspath(path), len(stats),
+                                       sum(stat.st_size for stat in stats), max([int(stat.st_mtime) for stat in stats] or [0]))
+        return key
+    stat = os.stat(path)
+    return '%s|%d|%s|%d|%d' % (kind, cache_version, os.path.abspath(path), stat.st_size, int(stat.st_mtime))
+
+class ResultsCache(object):
+
+    def __init__(self, path, max_size=cache_size):
+        self.path     = path
+        self.max_size = max_size
+        self.hits     = 0
+        self.misses   = 0
+        self.connect  = sqlite3.connect(path)
+        self.connect.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, size INTEGER, expires REAL, used REAL)")
+        self.connect.execute("CREATE INDEX IF NOT EXISTS cache_used ON cache (used)")
+
+    def get(self, key):
+        row = self.connect.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            self.misses += 1
+            return None
+        try:
+            value = cPickle.loads(str(row[0]))
+        except Exception: #written by another version (e.g. a class that no longer exists), truncated or foreign value
+            self.misses += 1
+            self.connect.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return None
+        self.hits += 1
+        self.connect.execute("UPDATE cache SET used = ? WHERE key = ?", (time.time(), key))
+        return value
+
+    def put(self, key, value, ttl):
+        value = cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+        now   = time.time()
+        self.connect.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                             (key, sqlite3.Binary(value), len(value), now + ttl, now))
+
+    def evict(self):
+        #expired entries first, then the least recently used ones until the cache fits in max_size
+        self.connect.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+        total = self.connect.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total > self.max_size:
+            evicted = []
+            for key, size in self.connect.execute("SELECT key, size FROM cache ORDER BY used"):
+                if total <= self.max_size:
+                    break
+                evicted.append((key,))
+                total -= size
+            self.connect.executemany("DELETE FROM cache WHERE key = ?", evicted)
+
+    def close(self):
+        self.evict()
+        self.connect.commit()
+        self.connect.close()
+
+    def get_summary(self):
+        return "Cache: %d hit(s), %d miss(es) (%s)" % (self.hits, self.misses, self.path)
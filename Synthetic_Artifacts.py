@@ -0,0 +1,388 @@
+'''
+*********************************** LICENSE ***********************************
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You can view the GNU General Public License at <http://www.gnu.org/licenses/>
+*******************************************************************************
+
+Synthetic_Artifacts - WARNING: This program is provided "as-is"
+
+Author    : Gabriele Zambelli (Twitter: @gazambelli)
+Blog      : http://forensenellanebbia.blogspot.it
+Version   : 20261018
+
+Script to write synthetic artifacts with a chosen number of entries (e.g. from 10 to 1,000,000), used by
+Benchmark.py to time the scripts of this repository and to check that they still parse every entry:
+ - storage-sync.sqlite    : NoScript policy in the 'collection_data' table (plus the rows of other extensions)
+ - storage.js             : Adblock Plus whitelisted websites, after a subscription with as many filters
+ - vlc-qt-interface.conf  : VLC 'RecentsMRL' section (media files with commas, quotes and non-ASCII characters)
+ - org.videolan.vlc.plist : VLC 'recentlyPlayedMedia' dictionary, written as a binary plist
+ - Local Extension Settings/<ID> : Adblock Plus for Chrome LevelDB folder: an older whitelist in a .ldb table
+                          (Snappy-compressed and uncompressed blocks) and the current one in the .log file
+Each function returns the number of records the scripts are expected to find in the file.
+The same entries and seed always give the same files.
+
+Requirements:
+ - Python 2.7
+'''
+
+import json
+import os
+import random
+import sqlite3
+import struct
+import sys
+import urllib
+
+import Firefox_AdblockPlus
+import Firefox_NoScript
+
+tlds = ('com', 'org', 'net', 'it', 'de', 'co.uk', 'onion')
+
+#functions
+def get_help():
+    print "\nScript to write synthetic NoScript, Adblock Plus and VLC media player artifacts"
+    print "\nOPTIONS:"
+    print "--entries N: Number of sites, websites and media files of each artifact (default: 1000)"
+    print "--seed N: Seed of the random generator (default: 0)"
+    print "\nEXAMPLE:"
+    print "python Synthetic_Artifacts.py synthetic_dir --entries 100000"
+
+def get_sites(entries, seed, prefix):
+    #entries distinct host names
+    rnd = random.Random(seed)
+    return ["%s%d.%s%d.%s" % (prefix, n, rnd.choice(('www', 'cdn', 'static', 'api')), rnd.randint(0, 999), rnd.choice(tlds))
+            for n in range(entries)]
+
+def write_storage_sync(path, entries, seed=0):
+    #a fifth of the sites is untrusted, some trusted sites are HTTPS only ('\xa7:' prefix)
+    #the default trusted sites are added too: the script doesn't list them
+    rnd    = random.Random(seed)
+    sites  = get_sites(entries, seed, 'ns')
+    policy = {"trusted": list(Firefox_NoScript.sites_trusted_default), "untrusted": [], "custom": {}}
+    for site in sites:
+        if rnd.random() < 0.2:
+            policy["untrusted"].append(site)
+        elif rnd.random() < 0.1:
+            policy["trusted"].append(Firefox_NoScript.secure_prefix + site)
+        else:
+            policy["trusted"].append(site)
+    record = {"id": "key-policy", "key": "policy", "_status": "synced", "last_modified": 1548633600000,
+              "data": {"sites": policy, "enforced": True, "autoAllowTop": False}}
+    if os.path.isfile(path):
+        os.remove(path)
+    connect = sqlite3.connect(path)
+    connect.execute("CREATE TABLE collection_data (collection_name TEXT, record_id TEXT, record TEXT, PRIMARY KEY (collection_name, record_id))")
+    connect.execute("CREATE TABLE collection_metadata (collection_name TEXT PRIMARY KEY, last_modified INTEGER, metadata TEXT)")
+    rows = [(Firefox_NoScript.noscript_collection, "key-policy", json.dumps(record, ensure_ascii=False, separators=(',', ':'))),
+            (Firefox_NoScript.noscript_collection, "key-xss", json.dumps({"id": "key-xss", "key": "xss", "data": {}})),
+            ("default/{d10d0bf8-f5b5-c8b4-a8b2-2b9879e08c5d}", "key-prefs", json.dumps({"id": "key-prefs", "data": {}}))]
+    connect.executemany("INSERT INTO collection_data VALUES (?, ?, ?)", rows)
+    connect.execute("INSERT INTO collection_metadata VALUES (?, ?, ?)", (Firefox_NoScript.noscript_collection, 1548633600000, "{}"))
+    connect.commit()
+    connect.close()
+    return entries
+
+def write_storage_js(path, entries, seed=0):
+    #a subscription with entries blocking filters (skipped by the script), then the whitelist of the user
+    sites   = get_sites(entries, seed, 'abp')
+    content = ["# Adblock Plus preferences", "version=5",
+               "[Subscription]", "url=https://easylist-downloads.adblockplus.org/easylist.txt", "title=EasyList",
+               "fixedTitle=true", "homepage=https://easylist.to/", "lastDownload=1548633600", "downloadStatus=synchronize_ok",
+               "", "[Subscription filters]"]
+    content.extend("||ads%d.example.com^$third-party" % n for n in range(entries))
+    content.extend(["", "[Subscription]", "url=~user~786254", "defaults=whitelist", "", "[Subscription filters]"])
+    content.extend("@@||%s^$document" % site for site in sites)
+    with open(path, "wb") as f:
+        json.dump({"file:patterns.ini": {"content": content}, "pref:notifications_ignoredcategories": []}, f, separators=(',', ':'))
+    return entries
+
+def get_media_files(entries, seed):
+    #file:// URLs as saved by VLC: spaces and non-ASCII characters are percent-encoded, commas are not
+    rnd   = random.Random(seed)
+    names = (u"holiday", u"lecture, part", u"concert \"live\"", u"r\xe9sum\xe9", u"\u65e5\u672c")
+    media = []
+    for n in range(entries):
+        name = u"%s %d.%s" % (rnd.choice(names), n, rnd.choice(('mp4', 'mkv', 'avi', 'mp3')))
+        path = u"/home/user/Videos/%d/%s" % (n % 100, name)
+        media.append("file://" + urllib.quote(path.encode('utf-8'), safe="/,\""))
+    return media
+
+def get_qt_value(item):
+    #QSettings quotes the items that contain a comma and escapes quotes and backslashes
+    item = item.replace("\\", "\\\\").replace('"', '\\"')
+    if "," in item:
+        return '"%s"' % item
+    return item
+
+def write_vlc_conf(path, entries, seed=0):
+    #times are in milliseconds; a zero value is saved for a tenth of the media files
+    rnd   = random.Random(seed)
+    media = get_media_files(entries, seed)
+    times = [0 if rnd.random() < 0.1 else rnd.randint(1, 7200) * 1000 for item in media]
+    with open(path, "wb") as f:
+        f.write("[General]\nfiledialog-path=@Variant(\\0\\0\\0\\x11\\0\\0\\0\\x1\\0)\n\n")
+        f.write("[RecentsMRL]\n")
+        f.write("list=%s\n" % ", ".join(get_qt_value(item) for item in media))
+        f.write("times=%s\n\n" % ", ".join(str(value) for value in times))
+        f.write("[MainWindow]\nplaylist-visible=false\n")
+    return entries
+
+def write_vlc_plist(path, entries, seed=0):
+    #times are in seconds
+    rnd   = random.Random(seed)
+    media = get_media_files(entries, seed)
+    plist = [("SUEnableAutomaticChecks", False), ("language", "auto"),
+             ("recentlyPlayedMedia", [(item, 0 if rnd.random() < 0.1 else rnd.randint(1, 7200)) for item in media]),
+             ("recentlyPlayedMediaList", [item for item in media[-10:]])]
+    with open(path, "wb") as f:
+        f.write(get_bplist(plist))
+    return entries
+
+def get_bplist(top):
+    #binary plist (bplist00) of a dictionary; dictionaries are lists of (key, value) pairs so that their order is kept
+    #supported values: bool, int, str (ASCII), unicode, list, dictionary
+    def get_count(value):
+        if isinstance(value, list) and len(value) > 0 and isinstance(value[0], tuple):
+            return 1 + sum(get_count(key) + get_count(item) for key, item in value)
+        if isinstance(value, list):
+            return 1 + sum(get_count(item) for item in value)
+        return 1
+    num_objects = get_count(top)
+    ref_size    = 1 if num_objects < 1 << 8 else 2 if num_objects < 1 << 16 else 4
+    ref_format  = {1: ">B", 2: ">H", 4: ">I"}[ref_size]
+    objects     = []
+    def get_int(value):
+        if value < 0 or value >= 1 << 32:
+            return "\x13" + struct.pack(">q", value)
+        if value < 1 << 8:
+            return "\x10" + struct.pack(">B", value)
+        if value < 1 << 16:
+            return "\x11" + struct.pack(">H", value)
+        return "\x12" + struct.pack(">I", value)
+    def get_marker(kind, count):
+        if count < 15:
+            return chr(kind << 4 | count)
+        return chr(kind << 4 | 0xf) + get_int(count)
+    def add(value):
+        ref = len(objects)
+        objects.append(None)
+        if isinstance(value, bool):
+            objects[ref] = "\x09" if value else "\x08"
+        elif isinstance(value, (int, long)):
+            objects[ref] = get_int(value)
+        elif isinstance(value, unicode):
+            try:
+                objects[ref] = get_marker(0x5, len(value)) + value.encode('ascii')
+            except UnicodeEncodeError:
+                data = value.encode('utf-16-be')
+                objects[ref] = get_marker(0x6, len(data) / 2) + data
+        elif isinstance(value, str):
+            objects[ref] = get_marker(0x5, len(value)) + value
+        elif len(value) > 0 and isinstance(value[0], tuple):
+            keys  = [add(key) for key, item in value]
+            items = [add(item) for key, item in value]
+            objects[ref] = get_marker(0xd, len(value)) + "".join(struct.pack(ref_format, item) for item in keys + items)
+        else:
+            items = [add(item) for item in value]
+            objects[ref] = get_marker(0xa, len(value)) + "".join(struct.pack(ref_format, item) for item in items)
+        return ref
+    add(top)
+    offsets = []
+    offset  = 8
+    for data in objects:
+        offsets.append(offset)
+        offset += len(data)
+    offset_size   = 1 if offset < 1 << 8 else 2 if offset < 1 << 16 else 4 if offset < 1 << 32 else 8
+    offset_format = {1: ">B", 2: ">H", 4: ">I", 8: ">Q"}[offset_size]
+    table = "".join(struct.pack(offset_format, item) for item in offsets)
+    return "bplist00" + "".join(objects) + table + struct.pack(">6xBBQQQ", offset_size, ref_size, len(objects), 0, offset)
+
+def get_varint(value):
+    data = ""
+    while value >= 0x80:
+        data  += chr(value & 0x7f | 0x80)
+        value >>= 7
+    return data + chr(value)
+
+def get_snappy(data):
+    #Snappy compression: repeated 4-byte sequences (found with a hash table) become copies, the rest literals
+    def get_literal(text):
+        if len(text) == 0:
+            return ""
+        if len(text) <= 60:
+            return chr((len(text) - 1) << 2) + text
+        size = struct.pack('<I', len(text) - 1).rstrip("\x00")
+        return chr((59 + len(size)) << 2) + size + text
+    output  = [get_varint(len(data))]
+    table   = {}
+    literal = 0 # start of the bytes not written yet
+    pos     = 0
+    while pos + 4 <= len(data):
+        candidate = table.get(data[pos:pos + 4])
+        table[data[pos:pos + 4]] = pos
+        if candidate is None or pos - candidate > 0xffff:
+            pos += 1
+            continue
+        length = 4
+        while pos + length < len(data) and length < 64 and data[candidate + length] == data[pos + length]:
+            length += 1
+        offset = pos - candidate
+        output.append(get_literal(data[literal:pos]))
+        if length <= 11 and offset < 2048: #1-byte offset
+            output.append(chr((offset >> 8) << 5 | (length - 4) << 2 | 1) + chr(offset & 0xff))
+        else:                              #2-byte offset (the copy may overlap the bytes it produces)
+            output.append(chr((length - 1) << 2 | 2) + struct.pack('<H', offset))
+        pos    += length
+        literal = pos
+    output.append(get_literal(data[literal:]))
+    return "".join(output)
+
+def get_table_block(entries):
+    #keys are prefix-compressed against the previous key; a single restart point
+    data     = []
+    previous = ""
+    for key, value in entries:
+        shared = 0
+        while shared < min(len(key), len(previous)) and key[shared] == previous[shared]:
+            shared += 1
+        data.append(get_varint(shared) + get_varint(len(key) - shared) + get_varint(len(value)) + key[shared:] + value)
+        previous = key
+    return "".join(data) + struct.pack('<II', 0, 1)
+
+def get_table(records, block_size=4096, compress=True):
+    #LevelDB table (.ldb): data blocks of about block_size bytes, an empty metaindex block, the index block, the footer
+    #records: (key, sequence, type, value) sorted by key, then by decreasing sequence (type 1: value, 0: deletion)
+    #as LevelDB does, a block is Snappy-compressed only if that saves at least 1/8 of its size
+    #the CRC of the blocks is not computed (the scripts don't check it)
+    entries = [(key + struct.pack('<Q', sequence << 8 | kind), value) for key, sequence, kind, value in records]
+    output  = []
+    offset  = [0]
+    def add(block):
+        kind = "\x00"
+        if compress:
+            compressed = get_snappy(block)
+            if len(compressed) < len(block) - len(block) / 8:
+                block, kind = compressed, "\x01"
+        handle = get_varint(offset[0]) + get_varint(len(block))
+        output.append(block + kind + "\x00" * 4)
+        offset[0] += len(block) + 5
+        return handle
+    index = []
+    block = []
+    size  = 0
+    for n, entry in enumerate(entries):
+        block.append(entry)
+        size += len(entry[0]) + len(entry[1])
+        if size >= block_size or n == len(entries) - 1:
+            index.append((block[-1][0], add(get_table_block(block)))) #the index key is the last key of the block
+            block = []
+            size  = 0
+    metaindex = add(get_table_block([]))
+    index     = add(get_table_block(index))
+    footer    = metaindex + index
+    return "".join(output) + footer + "\x00" * (40 - len(footer)) + Firefox_AdblockPlus.table_magic
+
+def get_log(batches):
+    #LevelDB log (.log): each write batch is split into FULL, or FIRST/MIDDLE.../LAST records, so that no record
+    #crosses a 32 KB block; the end of a block too short for a record header is zero-filled
+    #batches: (sequence, [(type, key, value)]) (type 1: value, 0: deletion)
+    block  = Firefox_AdblockPlus.log_block
+    output = []
+    size   = 0
+    for sequence, operations in batches:
+        batch = struct.pack('<QI', sequence, len(operations))
+        for kind, key, value in operations:
+            batch += chr(kind) + get_varint(len(key)) + key
+            if kind == 1:
+                batch += get_varint(len(value)) + value
+        first = True
+        while True:
+            left = block - size % block
+            if left < 7:
+                output.append("\x00" * left)
+                size += left
+                left  = block
+            chunk = batch[:left - 7]
+            batch = batch[left - 7:]
+            if first:
+                kind = 1 if len(batch) == 0 else 2
+            else:
+                kind = 4 if len(batch) == 0 else 3
+            output.append(struct.pack('<IHB', 0, len(chunk), kind) + chunk)
+            size += 7 + len(chunk)
+            first = False
+            if len(batch) == 0:
+                break
+    return "".join(output)
+
+def get_patterns(sites, filters=0):
+    #value of the 'file:patterns.ini' key saved by Adblock Plus for Chrome
+    content = ["# Adblock Plus preferences", "version=5", "[Subscription]", "url=https://easylist-downloads.adblockplus.org/easylist.txt",
+               "title=EasyList", "", "[Subscription filters]"]
+    content.extend("||ads%d.example.com^$third-party" % n for n in range(filters))
+    content.extend(["", "[Subscription]", "url=~user~786254", "defaults=whitelist", "", "[Subscription filters]"])
+    content.extend("@@||%s^$document" % site for site in sites)
+    return json.dumps({"content": content, "lastModified": 1548633600000}, separators=(',', ':'))
+
+def write_leveldb(path, entries, seed=0):
+    #the table holds two older versions of the whitelist (the same key in several data blocks) and other keys;
+    #the .log file holds the current whitelist (split over several log blocks when it is large)
+    sites = get_sites(entries, seed, 'crx')
+    key   = Firefox_AdblockPlus.chrome_keys[0]
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    records = [("file:notifications.json", 4, 1, json.dumps({"notifications": []})),
+               (key, 3, 1, get_patterns(sites[:entries / 2], entries)),
+               (key, 2, 1, get_patterns(sites[:entries / 3], entries)),
+               ("pref:subscriptions_exceptionsurl", 1, 1, '"https://easylist-downloads.adblockplus.org/exceptionrules.txt"')]
+    with open(os.path.join(path, "000005.ldb"), "wb") as f:
+        f.write(get_table(records))
+    with open(os.path.join(path, "000006.log"), "wb") as f:
+        f.write(get_log([(5, [(1, "pref:notifications_ignoredcategories", "[]")]), (6, [(1, key, get_patterns(sites))])]))
+    for name, data in (("CURRENT", "MANIFEST-000004\n"), ("LOCK", ""), ("LOG", "")):
+        with open(os.path.join(path, name), "wb") as f:
+            f.write(data)
+    return entries
+
+writers = [('storage-sync.sqlite', write_storage_sync), ('storage.js', write_storage_js),
+           ('vlc-qt-interface.conf', write_vlc_conf), ('org.videolan.vlc.plist', write_vlc_plist),
+           (os.path.join('Local Extension Settings', Firefox_AdblockPlus.chrome_id), write_leveldb)]
+
+def get_artifacts(folder, entries, seed=0):
+    #writes the artifacts in folder and returns [(path, expected records)]
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    return [(os.path.join(folder, filename), writer(os.path.join(folder, filename), entries, seed)) for filename, writer in writers]
+
+def main(argv):
+    args    = argv[1:]
+    folder  = None
+    entries = 1000
+    seed    = 0
+    while len(args) > 0:
+        arg = args.pop(0)
+        if arg in ('--entries', '--seed') and len(args) > 0 and args[0].isdigit():
+            if arg == '--entries':
+                entries = int(args.pop(0))
+            else:
+                seed = int(args.pop(0))
+        else:
+            folder = arg
+    if folder is None:
+        get_help()
+        return
+    for path, expected in get_artifacts(folder, entries, seed):
+        print "%s (%d entries)" % (path, expected)
+
+#start
+if __name__ == '__main__':
+    main(sys.argv)
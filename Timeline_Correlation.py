@@ -0,0 +1,342 @@
+'''
+*********************************** LICENSE ***********************************
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You can view the GNU General Public License at <http://www.gnu.org/licenses/>
+*******************************************************************************
+
+Timeline_Correlation - WARNING: This program is provided "as-is"
+
+Author    : Gabriele Zambelli (Twitter: @gazambelli)
+Blog      : http://forensenellanebbia.blogspot.it
+Version   : 20261018
+
+Script to correlate the results of VLC_LastPlayedPosition, Firefox_NoScript and Firefox_AdblockPlus.
+The artifacts found under one or more directories are parsed as in Batch_Artifacts.py, then every media file
+played by VLC is joined with the NoScript and Adblock Plus websites of the same user whose artifact files
+were modified within a time window of the VLC file.
+ - the user is the home folder of the artifact (e.g. C:\\Users\\<username>, /home/<username>, /Users/<username>)
+ - the time of an artifact is the modification time of its file (or of the latest file of a LevelDB folder)
+
+The records are kept in memory in a columnar index: one row per artifact file, the files of each user sorted
+by time (a window is two binary searches), posting lists of the files by website and by media file, and the
+websites sorted by reversed labels so that a domain matches its subdomains too.
+
+Requirements:
+ - Python 2.7
+'''
+
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime
+import array
+import csv
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import Batch_Artifacts
+import Firefox_NoScript
+import Output_Writers
+import Results_Cache
+
+Correlation = namedtuple('Correlation', 'owner media_file position media_time domain value domain_time artifact vlc_file browser_file')
+
+home_dirs = ('users', 'home', 'documents and settings') # folders that contain the home folder of each user
+window    = 24 * 3600 # default time window (seconds)
+
+#functions
+def get_help():
+    print "\nScript to correlate the VLC media player, NoScript and Adblock Plus artifacts of the same user"
+    print "\nOPTIONS:"
+    print "--window SECONDS: Join the artifact files modified within SECONDS of each other (default: %d)" % window
+    print "--domain DOMAIN: Only list the websites matching DOMAIN or its subdomains"
+    print "--media TEXT: Only list the media files whose path contains TEXT"
+    print "--value VALUE: Only list the websites with this value (e.g. trusted, whitelisted). Can be repeated"
+    print "--csv FILE: Read the records from a CSV file written by Batch_Artifacts.py instead of parsing the directories"
+    print "--jobs N: Number of processes used to parse the files (default: number of CPUs)"
+    print "--cache FILE: Keep the parsed files in FILE (see Batch_Artifacts.py)"
+    print "--output FILE: Output file (default: <date>_<time>_timeline.csv)"
+    print "--format FORMAT: Output format: csv, jsonl or columnar (default: from the extension of the output file)"
+    print "--benchmark N: Build an index of N synthetic records and time the queries"
+    print "\nEXAMPLES:"
+    print "python Timeline_Correlation.py E:\\ F:\\ --window 3600"
+    print "python Timeline_Correlation.py /mnt/image1 --domain example.com --value trusted --value whitelisted"
+    print "python Timeline_Correlation.py --csv 20190128_101500_batch.csv --media .mkv"
+
+def get_owner(path):
+    #home folder of the user the artifact belongs to, or the folder of the artifact
+    parts = path.replace('\\', '/').split('/')
+    for n in range(len(parts) - 2, -1, -1):
+        if parts[n].lower() in home_dirs:
+            return '/'.join(parts[:n + 2])
+    return '/'.join(parts[:-1])
+
+def get_reversed(host):
+    #example.com -> com.example. (a domain is a prefix of its subdomains)
+    return '.'.join(reversed(host.split('.'))) + '.'
+
+def get_file_time(path):
+    #latest modification time of the artifact (a LevelDB folder, or a SQLite database and its WAL)
+    if os.path.isdir(path):
+        return max([os.path.getmtime(os.path.join(path, name)) for name in os.listdir(path)] or [os.path.getmtime(path)])
+    mtimes = [os.path.getmtime(path)]
+    if os.path.isfile(path + '-wal'):
+        mtimes.append(os.path.getmtime(path + '-wal'))
+    return max(mtimes)
+
+def get_time_text(timestamp):
+    return datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+class TimelineIndex(object):
+
+    def __init__(self):
+        #one entry per artifact file
+        self.file_owner    = []
+        self.file_time     = array.array('d')
+        self.file_artifact = []
+        self.file_path     = []
+        self.file_items    = [] # list of (item, value) of each file
+        self.owner_files   = {} # owner -> ids of the files
+        self.domain_files  = {} # host -> ids of the files
+        self.media_files   = {} # media file -> ids of the files
+        self.n_records     = 0
+        self.timelines     = None
+
+    def add_file(self, artifact, owner, path, timestamp, items):
+        #items are (item, value) pairs: (media file, position) for VLC, (website, value) for NoScript/Adblock Plus
+        file_id = len(self.file_path)
+        if artifact != 'VLC':
+            items = [(Firefox_NoScript.get_hostname(item), value) for item, value in items]
+        self.file_owner.append(owner)
+        self.file_time.append(timestamp)
+        self.file_artifact.append(artifact)
+        self.file_path.append(path)
+        self.file_items.append(items)
+        self.owner_files.setdefault(owner, []).append(file_id)
+        postings = self.media_files if artifact == 'VLC' else self.domain_files
+        for item in set(item for item, value in items):
+            postings.setdefault(item, []).append(file_id)
+        self.n_records += len(items)
+        self.timelines = None
+        return file_id
+
+    def build(self):
+        #owner -> (times of the VLC files, ids of the VLC files, times of the browser files, ids of the browser files)
+        self.timelines = {}
+        for owner, file_ids in self.owner_files.iteritems():
+            media   = sorted((self.file_time[file_id], file_id) for file_id in file_ids if self.file_artifact[file_id] == 'VLC')
+            domains = sorted((self.file_time[file_id], file_id) for file_id in file_ids if self.file_artifact[file_id] != 'VLC')
+            self.timelines[owner] = (array.array('d', [t for t, file_id in media]), [file_id for t, file_id in media],
+                                     array.array('d', [t for t, file_id in domains]), [file_id for t, file_id in domains])
+        self.reversed_domains = sorted((get_reversed(host), host) for host in self.domain_files)
+
+    def get_domains(self, domain):
+        #hosts equal to domain or subdomains of it
+        if self.timelines is None:
+            self.build()
+        prefix = get_reversed(Firefox_NoScript.get_hostname(domain))
+        n      = bisect_left(self.reversed_domains, (prefix,))
+        hosts  = set()
+        while n < len(self.reversed_domains) and self.reversed_domains[n][0].startswith(prefix):
+            hosts.add(self.reversed_domains[n][1])
+            n += 1
+        return hosts
+
+    def get_media(self, text):
+        text = text.lower()
+        return set(media for media in self.media_files if text in media.lower())
+
+    def get_correlations(self, window=window, owner=None, domain=None, media=None, values=None):
+        #yields a Correlation for each (media file, website) pair of the same owner within window seconds
+        if self.timelines is None:
+            self.build()
+        hosts  = self.get_domains(domain) if domain is not None else None
+        medias = self.get_media(media) if media is not None else None
+        owners = set(self.timelines) if owner is None else set([owner]) & set(self.timelines)
+        #the posting lists narrow down the owners to visit
+        if hosts is not None:
+            owners &= set(self.file_owner[file_id] for host in hosts for file_id in self.domain_files[host])
+        if medias is not None:
+            owners &= set(self.file_owner[file_id] for path in medias for file_id in self.media_files[path])
+        for name in sorted(owners):
+            media_times, media_ids, domain_times, domain_ids = self.timelines[name]
+            if len(media_ids) == 0 or len(domain_ids) == 0:
+                continue
+            for media_time, media_id in zip(media_times, media_ids):
+                lo = bisect_left(domain_times, media_time - window)
+                hi = bisect_right(domain_times, media_time + window)
+                if lo == hi:
+                    continue
+                media_items = [item for item in self.file_items[media_id] if medias is None or item[0] in medias]
+                for domain_id in domain_ids[lo:hi]:
+                    domain_items = [item for item in self.file_items[domain_id]
+                                    if (hosts is None or item[0] in hosts) and (values is None or item[1] in values)]
+                    for media_file, position in media_items:
+                        for host, value in domain_items:
+                            yield Correlation(name, media_file, position, media_time, host, value, self.file_time[domain_id],
+                                              self.file_artifact[domain_id], self.file_path[media_id], self.file_path[domain_id])
+
+    def get_summary(self):
+        return "Index: %d record(s), %d file(s), %d user(s), %d website(s), %d media file(s)" % (
+            self.n_records, len(self.file_path), len(self.owner_files), len(self.domain_files), len(self.media_files))
+
+def add_rows(index, task, rows):
+    #rows of Batch_Artifacts.get_rows: Artifact,Profile,Item,Value,Raw value,File
+    artifact, path = task
+    try:
+        timestamp = get_file_time(path)
+    except OSError:
+        return False
+    index.add_file(artifact, get_owner(path), path, timestamp, [(row[2], row[3]) for row in rows])
+    return True
+
+def get_index(roots, jobs, cache=None):
+    index  = TimelineIndex()
+    errors = []
+    for task, path, rows, error in Batch_Artifacts.get_results(Batch_Artifacts.get_files(roots), jobs, cache):
+        if error is not None:
+            errors.append((path, error))
+        elif not add_rows(index, task, rows):
+            errors.append((path, 'file not found'))
+    return index, errors
+
+def get_index_csv(fn):
+    #the rows of a file (a Chrome LevelDB folder is split by .ldb/.log file) are grouped by (Artifact, File)
+    index  = TimelineIndex()
+    errors = []
+    tasks  = {}
+    with open(fn, 'rb') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            artifact, path = row[0], row[5]
+            if artifact == 'AdblockPlus' and os.path.isdir(os.path.dirname(path)) and os.path.basename(os.path.dirname(path)) == Batch_Artifacts.Firefox_AdblockPlus.chrome_id:
+                path = os.path.dirname(path)
+            tasks.setdefault((artifact, path), []).append([value.decode('utf-8') for value in row])
+    for task in sorted(tasks):
+        if not add_rows(index, task, tasks[task]):
+            errors.append((task[1], 'file not found'))
+    return index, errors
+
+def get_timeline(index, fn, window=window, domain=None, media=None, values=None, format=None):
+    print index.get_summary()
+    header = ['User', 'Media file', 'Last played position', 'VLC file time (UTC)', 'Website', 'Value',
+              'Browser file time (UTC)', 'Artifact', 'VLC file', 'Browser file']
+    with Output_Writers.get_writer(fn, header, format) as writer:
+        writer.write_rows([c.owner, c.media_file, c.position, get_time_text(c.media_time), c.domain, c.value,
+                           get_time_text(c.domain_time), c.artifact, c.vlc_file, c.browser_file]
+                          for c in index.get_correlations(window, domain=domain, media=media, values=values))
+    print "Correlations saved: %d" % writer.rows
+    print "\nOutput saved to: %s" % fn
+
+def get_synthetic_index(n_records, seed=0):
+    #n_records records in files of 10 records, 4 files (VLC, NoScript, Adblock Plus, Chrome) per user
+    rnd       = random.Random(seed)
+    index     = TimelineIndex()
+    start     = 1546300800.0 # 2019-01-01
+    artifacts = ('VLC', 'NoScript', 'AdblockPlus', 'AdblockPlus')
+    values    = {'VLC': '0:02:05', 'NoScript': 'trusted', 'AdblockPlus': 'whitelisted'}
+    for n in range(max(1, n_records / 10)):
+        user     = n / 4
+        artifact = artifacts[n % 4]
+        owner    = '/mnt/image%d/Users/user%d' % (user % 100, user)
+        if artifact == 'VLC':
+            items = [('file:///C:/Users/user%d/Videos/video%d.mp4' % (user, rnd.randint(0, 99999)), values[artifact]) for i in range(10)]
+        else:
+            items = [('site%d.example%d.com' % (rnd.randint(0, 9999), rnd.randint(0, 99)), values[artifact]) for i in range(10)]
+        index.add_file(artifact, owner, '%s/%s/%d' % (owner, artifact, n), start + rnd.randint(0, 365 * 24 * 3600), items)
+    return index
+
+def get_benchmark(n_records):
+    def get_elapsed(function):
+        s_time = time.time()
+        result = function()
+        return result, time.time() - s_time
+    index, elapsed = get_elapsed(lambda: get_synthetic_index(n_records))
+    print "\n%s" % index.get_summary()
+    print "Load            : %.3f s" % elapsed
+    result, elapsed = get_elapsed(index.build)
+    print "Build           : %.3f s" % elapsed
+    queries = [("All, 1 hour    ", lambda: index.get_correlations(3600)),
+               ("All, 1 day     ", lambda: index.get_correlations(24 * 3600)),
+               ("Domain, 30 days", lambda: index.get_correlations(30 * 24 * 3600, domain='example7.com')),
+               ("Media, 30 days ", lambda: index.get_correlations(30 * 24 * 3600, media='video4242.')),
+               ("User, 365 days ", lambda: index.get_correlations(365 * 24 * 3600, owner=index.file_owner[0]))]
+    for name, query in queries:
+        result, elapsed = get_elapsed(lambda: sum(1 for correlation in query()))
+        print "%s : %.3f s (%d correlations)" % (name, elapsed, result)
+
+def main(argv):
+    argv, fn, format = Output_Writers.get_output_args(argv, 'timeline')
+    roots     = []
+    jobs      = multiprocessing.cpu_count()
+    cache     = None
+    csv_fn    = None
+    seconds   = window
+    domain    = None
+    media     = None
+    values    = None
+    benchmark = None
+    args      = argv[1:]
+    while len(args) > 0:
+        arg = args.pop(0)
+        if arg in ('--jobs', '--window', '--benchmark') and len(args) > 0 and args[0].isdigit():
+            number = int(args.pop(0))
+            if arg == '--jobs':
+                jobs = max(1, number)
+            elif arg == '--window':
+                seconds = number
+            else:
+                benchmark = number
+        elif arg == '--cache' and len(args) > 0:
+            cache = args.pop(0)
+        elif arg == '--csv' and len(args) > 0:
+            csv_fn = args.pop(0)
+        elif arg == '--domain' and len(args) > 0:
+            domain = args.pop(0)
+        elif arg == '--media' and len(args) > 0:
+            media = args.pop(0).decode(sys.getfilesystemencoding() or 'utf-8')
+        elif arg == '--value' and len(args) > 0:
+            values = (values or set()) | set([args.pop(0)])
+        elif os.path.isdir(arg):
+            roots.append(os.path.abspath(arg))
+        else:
+            print "\nThe following directory was not found: %s" % arg
+    if benchmark is not None:
+        get_benchmark(benchmark)
+        return
+    if len(roots) == 0 and csv_fn is None:
+        get_help()
+        return
+    if cache is not None:
+        cache = Results_Cache.ResultsCache(cache)
+    try:
+        if csv_fn is not None:
+            index, errors = get_index_csv(csv_fn)
+        else:
+            index, errors = get_index(roots, jobs, cache)
+    finally:
+        if cache is not None:
+            print cache.get_summary()
+            cache.close()
+    if len(errors) > 0:
+        print "\nThe following files could not be parsed: (%d)" % len(errors)
+        for path, error in errors:
+            print "- %s (%s)" % (path, error)
+    print
+    get_timeline(index, fn, seconds, domain, media, values, format)
+
+#start
+if __name__ == '__main__':
+    main(sys.argv)
@@ -25,24 +25,44 @@ Win   : C:/Users/<username>/AppData/Roaming/vlc/vlc-qt-interface.ini
 Ubuntu: /home/<username>/.config/vlc/vlc-qt-interface.conf
 macOS : /Users/<username>/Library/Preferences/org.videolan.vlc.plist
 
+The functions get_recents_WinNix, get_recents_macOS and get_recents can also be imported: they yield
+Recent records (number, media_file, position, raw_value, vlc_file) without printing or writing anything.
+
+The binary plist is parsed without third-party modules: the trailer and the offset table are read first, then only
+the objects referenced by the 'recentlyPlayedMedia' key are decoded from the memory-mapped file.
+XML plists are parsed with plistlib.
+
 Requirements:
  - Python 2.7
- - biplist (pip install biplist)
-   https://github.com/wooster/biplist
 
 Scripted tested with:
  - VLC media player 3.0.5/3.0.6. Based on my tests, a zero value may either mean that the file has been fully played
    or that less than five percent of the file contents has been played.
 '''
 
+from collections import namedtuple, OrderedDict
 from datetime import datetime, timedelta
-import biplist
+from itertools import izip_longest
 import getpass
+import mmap
 import os
 import platform
+import plistlib
+import struct
 import sys
 import urllib
 
+import Metrics
+import Output_Writers
+
+# position is a timedelta, or None when VLC stored a zero value
+Recent = namedtuple('Recent', 'number media_file position raw_value vlc_file')
+
+# escape sequences used by QSettings in the values of .ini/.conf files
+qt_escapes = {"a": "\a", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v", "0": "\0"}
+
+plist_epoch = datetime(2001, 1, 1) # dates of a binary plist are seconds since this date
+
 #functions
 def get_help():
 	print "\n Script to extract the last played position of the files opened with VLC media player"
@@ -51,120 +71,254 @@ def get_help():
 	print "  - Win   : python VLC_LastPlayedPosition.py vlc-qt-interface.ini"
 	print "  - Ubuntu: python VLC_LastPlayedPosition.py vlc-qt-interface.conf"
 	print "  - macOS : python VLC_LastPlayedPosition.py org.videolan.vlc.plist"
-	print "\n (All output goes to stdout and to a tab-delimited text file)"
+	print "\n OPTIONS:\n  --output FILE  : Output file (default: <date>_<time>_vlc.csv)"
+	print "  --format FORMAT: Output format: csv, jsonl or columnar (default: from the extension of the output file)"
+	print "  --metrics FILE : Save the time spent parsing and writing and the size of the files read to FILE (JSON)"
+	print "\n (All output goes to stdout and to the output file)"
 
-def get_LPP_WinNix(vlc_path, fn):
-	try:
-		file = open(vlc_path, "r")
-		print "\nAnalyzing file: %s..." % vlc_path
-	except:
-		print '\nThe following file was not found:\n%s\n' % vlc_path
-		sys.exit()
-	file = file.readlines()
+def get_ini_section(vlc_path, section):
+	#yields (key, value) for each line of one section of a Qt .ini/.conf file, reading the file line by line
+	header     = "[%s]" % section
+	in_section = False
+	with open(vlc_path, "r") as file:
+		for line in file:
+			line = line.rstrip("\r\n").lstrip("\xef\xbb\xbf") # UTF-8 BOM
+			if line.startswith("["):
+				if in_section: # the next section starts: no need to read the rest of the file
+					return
+				in_section = line.strip() == header
+			elif in_section and "=" in line:
+				key, value = line.split("=", 1)
+				yield key.strip(), value
+
+def get_qt_list(value):
+	#yields the items of a list written by QSettings: a, "b, with comma", c\"d
+	if value.strip() in ("", "@Invalid()"):
+		return
+	item   = []
+	quoted = False
+	i      = 0
+	while i < len(value):
+		char = value[i]
+		if char == '"':
+			quoted = not quoted
+		elif char == "\\" and i + 1 < len(value):
+			i += 1
+			char = value[i]
+			if char == "x": # \xHHHH: a Unicode character
+				digits = ""
+				while i + 1 < len(value) and len(digits) < 4 and value[i + 1] in "0123456789abcdefABCDEF":
+					i += 1
+					digits += value[i]
+				item.append(unichr(int(digits, 16)).encode("utf-8") if digits else "x")
+			else:
+				item.append(qt_escapes.get(char, char))
+		elif char == "," and quoted == False:
+			yield "".join(item).strip()
+			item = []
+		else:
+			item.append(char)
+		i += 1
+	yield "".join(item).strip()
+
+def get_recents_WinNix(vlc_path):
+	#yields a Recent record for each entry of the 'RecentsMRL' section (the keys can be in any order)
+	values = dict((key, value) for key, value in get_ini_section(vlc_path, "RecentsMRL") if key in ("list", "times"))
+	if "list" in values:
+		i = 0
+		for item, raw_value in izip_longest(get_qt_list(values["list"]), get_qt_list(values.get("times", ""))):
+			if item is None: # more times than media files
+				break
+			if raw_value is None: # no time saved for the media file
+				raw_value = "0"
+			if len(item) > 1:
+				fp = urllib.unquote(item) # full path
+				fp = fp.rstrip(",")
+				lpp, raw_value = get_lpp(raw_value, vlc_path)
+				yield Recent(i + 1, fp, lpp, raw_value, vlc_path)
+			i += 1
+
+def get_recents_macOS(vlc_path):
+	#yields a Recent record for each entry of the 'recentlyPlayedMedia' dictionary
 	i = 0
-	for line in file:
-		if "RecentsMRL" in line:
-			if "list=" in file[i + 1]:  # list= is one line after RecentsMRL
-				vlc_list.append(file[i + 1].replace("list=", "").replace("\n", "").split(", "))
-			if "times=" in file[i + 2]:  # times= is two lines after RecentsMRL
-				vlc_times.append(file[i + 2].replace("times=", "").replace("\n", "").split(", "))
+	for key, val in get_plist_value(vlc_path, 'recentlyPlayedMedia').items():
+		if isinstance(key, unicode):
+			key = key.encode("utf-8")
+		if len(key) > 1:
+			fp = urllib.unquote(key) # full path
+			fp = fp.rstrip(",")
+			lpp, raw_value = get_lpp(val, vlc_path)
+			yield Recent(i + 1, fp, lpp, raw_value, vlc_path)
 		i += 1
-	if len(vlc_list) == 0:
+
+def get_plist_value(plist_path, top_key):
+	#returns the value of a key of the top-level dictionary of a binary or XML plist (KeyError if missing)
+	with open(plist_path, "rb") as f:
+		if f.read(8) != "bplist00":
+			return plistlib.readPlist(plist_path)[top_key]
+		plist = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	try:
+		# trailer: 6 unused bytes, size of the offsets, size of the references, number of objects, top object, offset table
+		offset_size, ref_size, num_objects, top_object, table_offset = struct.unpack(">6xBBQQQ", plist[-32:])
+		def get_offset(ref):
+			if ref >= num_objects:
+				raise ValueError("invalid object reference %d" % ref)
+			return get_int(plist[table_offset + ref * offset_size:table_offset + (ref + 1) * offset_size])
+		def get_refs(pos, count):
+			return [get_int(plist[pos + n * ref_size:pos + (n + 1) * ref_size]) for n in range(count)]
+		def get_object(ref):
+			pos    = get_offset(ref)
+			marker = ord(plist[pos])
+			kind   = marker >> 4
+			info   = marker & 0x0f
+			if kind == 0x0:
+				return {0x8: False, 0x9: True}.get(info)
+			if kind == 0x1:
+				value = plist[pos + 1:pos + 1 + (1 << info)]
+				if len(value) == 8:
+					return struct.unpack(">q", value)[0]
+				return get_int(value)
+			if kind == 0x2:
+				return struct.unpack(">f" if info == 2 else ">d", plist[pos + 1:pos + 1 + (1 << info)])[0]
+			if kind == 0x3:
+				return plist_epoch + timedelta(seconds=struct.unpack(">d", plist[pos + 1:pos + 9])[0])
+			if kind == 0x8:
+				return get_int(plist[pos + 1:pos + 2 + info])
+			count, pos = get_count(pos, info)
+			if kind in (0x4, 0x5):
+				return plist[pos:pos + count]
+			if kind == 0x6:
+				return plist[pos:pos + 2 * count].decode("utf-16-be")
+			if kind == 0xa:
+				return [get_object(item) for item in get_refs(pos, count)]
+			if kind == 0xd:
+				keys = get_refs(pos, count)
+				return OrderedDict((get_object(key), get_object(value)) for key, value in zip(keys, get_refs(pos + count * ref_size, count)))
+			raise ValueError("unsupported object type 0x%x" % marker)
+		def get_count(pos, info):
+			#returns (number of items, position of the first item)
+			if info != 0x0f:
+				return info, pos + 1
+			size = 1 << (ord(plist[pos + 1]) & 0x0f)
+			return get_int(plist[pos + 2:pos + 2 + size]), pos + 2 + size
+		#only the keys of the top dictionary and the value of top_key are decoded
+		pos    = get_offset(top_object)
+		marker = ord(plist[pos])
+		if marker >> 4 != 0xd:
+			raise KeyError(top_key)
+		count, pos = get_count(pos, marker & 0x0f)
+		keys = get_refs(pos, count)
+		for n, key in enumerate(keys):
+			if get_object(key) == top_key:
+				return get_object(get_refs(pos + count * ref_size, count)[n])
+		raise KeyError(top_key)
+	finally:
+		plist.close()
+
+def get_int(data):
+	#unsigned big-endian integer of any size
+	value = 0
+	for byte in data:
+		value = (value << 8) | ord(byte)
+	return value
+
+def get_recents(vlc_path):
+	if vlc_path.endswith('.plist'):
+		return get_recents_macOS(vlc_path)
+	return get_recents_WinNix(vlc_path)
+
+def get_lpp(raw_value, vlc_path):
+	#returns (last played position or None, raw value)
+	if vlc_path.endswith('.plist'):
+		vlc_seconds = int(raw_value) # time value already in seconds
+	else:
+		raw_value   = raw_value.replace(",", "")
+		vlc_seconds = (int(raw_value) / 1000)  # time value is in milliseconds
+	if int(raw_value) > 0:
+		return timedelta(seconds=vlc_seconds), raw_value
+	return None, raw_value
+
+def get_LPP_WinNix(vlc_path, fn, format=None):
+	if os.path.isfile(vlc_path) == False:
+		print '\nThe following file was not found:\n%s\n' % vlc_path
+		return
+	print "\nAnalyzing file: %s..." % vlc_path
+	with Metrics.timer("vlc.parse"):
+		recents = list(get_recents_WinNix(vlc_path))
+	Metrics.count_file("vlc.file_size", vlc_path)
+	if len(recents) == 0:
 		print "\nNo recent item found"
-		sys.exit()
+		return
 	print "\n%s" % ("-" * 42)
 	print " VLC media player ('RecentsMRL' section)"
 	print " The entries are listed by default from\n the most recent to the oldest"
 	print "%s" % ("-" * 42)
-	print "\n# | Last Played Position (h:mm:ss) | Media file"
-	f = open(fn, "w")
-	f.write("#\tMedia file\tLast Played Position (h:mm:ss)\tLast Played Position (raw value)\tVLC file\n")
-	i = 0
-	for item in vlc_list[0]:
-		if len(item) > 1:
-			fp = urllib.unquote(vlc_list[0][i]) # full path
-			fp = fp.rstrip(",")
-			raw_value = vlc_times[0][i]
-			get_output(f, fp, raw_value, i, vlc_path)
-		i += 1
-	f.close()
-	print "\nOutput saved to: %s" % fn
+	get_output(recents, fn, format)
 
-def get_LPP_macOS(vlc_path, fn):
-	try:
-		file = biplist.readPlist(vlc_path)
-		print "\nAnalyzing file: %s..." % vlc_path
-	except:
+def get_LPP_macOS(vlc_path, fn, format=None):
+	if os.path.isfile(vlc_path) == False:
 		print '\nThe following file was not found: %s\n' % vlc_path
-		sys.exit()
-	i = 0
+		return
+	print "\nAnalyzing file: %s..." % vlc_path
 	try:
-		for key, val in file['recentlyPlayedMedia'].items():
-			vlc_list.append(key)
-			vlc_times.append(val)
+		with Metrics.timer("vlc.parse"):
+			recents = list(get_recents_macOS(vlc_path))
+		Metrics.count_file("vlc.file_size", vlc_path)
 	except:
 		print "\nNo file was found under 'recentlyPlayedMedia' in the file.\n"
-		sys.exit()
-	if len(vlc_list) == 0:
+		return
+	if len(recents) == 0:
 		print "\nNo recent item found"
-		sys.exit()
+		return
 	print "\n%s" % ("-" * 49)
 	print " VLC media player ('recentlyPlayedMedia' section)"
 	print "%s" % ("-" * 49)
+	get_output(recents, fn, format)
+
+def get_output(recents, fn, format=None):
 	print "\n# | Last Played Position (h:mm:ss) | Media file"
-	f = open(fn, "w")
-	f.write("#\tMedia file\tLast Played Position (h:mm:ss)\tLast Played Position (raw value)\tVLC file\n")
-	i = 0
-	for item in vlc_list:
-		if len(item) > 1:
-			fp = urllib.unquote(item) # full path
-			fp = fp.rstrip(",")
-			raw_value = vlc_times[i]
-			get_output(f, fp, raw_value, i, vlc_path)
-		i += 1
-	f.close()
+	rows = []
+	for recent in recents:
+		if recent.position is not None:
+			print "%d | %s | %s" % (recent.number, recent.position, recent.media_file)
+			rows.append([recent.number, recent.media_file, recent.position, recent.raw_value, recent.vlc_file])
+		else:
+			print "%d |   N/A   | %s" % (recent.number, recent.media_file)
+			rows.append([recent.number, recent.media_file, "N/A", recent.raw_value, recent.vlc_file])
+	header = ["#", "Media file", "Last Played Position (h:mm:ss)", "Last Played Position (raw value)", "VLC file"]
+	with Metrics.timer("output.write"):
+		with Output_Writers.get_writer(fn, header, format) as writer:
+			writer.write_rows(rows)
 	print "\nOutput saved to: %s" % fn
 
-def get_output(f, fp, raw_value, i, vlc_path):
-	if vlc_path.endswith('.plist'):
-		vlc_seconds = int(raw_value) # time value already in seconds
-	else:
-		raw_value   = raw_value.replace(",", "")
-		vlc_seconds = (int(raw_value) / 1000)  # time value is in milliseconds
-	if int(raw_value) > 0:
-		lpp = timedelta(seconds=vlc_seconds)  # last played position
-		print "%d | %s | %s" % (i + 1, lpp, fp)
-		f.write("%d\t%s\t%s\t%s\t%s\n" % (i + 1, fp, lpp, raw_value, vlc_path))
+def main(argv):
+	argv, fn, format = Output_Writers.get_output_args(argv, "vlc")
+	argv, metrics_fn = Metrics.get_metrics_args(argv)
+	myOS      = platform.system()
+	username  = getpass.getuser()
+	if len(argv) == 2:
+		if argv[1] == '--default-path':
+			if myOS == 'Windows':
+				vlc_path = 'C:/Users/' + username + '/AppData/Roaming/vlc/vlc-qt-interface.ini'
+				get_LPP_WinNix(vlc_path, fn, format)
+			if myOS == 'Linux':
+				vlc_path = '/home/' + username + '/.config/vlc/vlc-qt-interface.conf'
+				get_LPP_WinNix(vlc_path, fn, format)
+			if myOS == 'Darwin':
+				vlc_path = '/Users/' + username + '/Library/Preferences/org.videolan.vlc.plist'
+				get_LPP_macOS(vlc_path, fn, format)
+		elif 'vlc-qt-interface' in argv[1]:
+			vlc_path = os.path.abspath(argv[1])
+			get_LPP_WinNix(vlc_path, fn, format)
+		elif 'org.videolan.vlc.plist' in argv[1]:
+			vlc_path = os.path.abspath(argv[1])
+			get_LPP_macOS(vlc_path, fn, format)
+		else:
+			get_help()
 	else:
-		print "%d |   N/A   | %s" % (i + 1, fp)
-		f.write("%d\t%s\tN/A\t%s\t%s\n" % (i + 1, fp, raw_value, vlc_path))
+		get_help()
+	Metrics.write_summary(metrics_fn)
 
 #start
-s_time = datetime.now()  # script starting time
-p_time = s_time.strftime('%Y%m%d_%H%M%S')  # prefix time
-fn     = p_time + "_vlc.csv"  # output file
-myOS      = platform.system()
-username  = getpass.getuser()
-vlc_list  = []
-vlc_times = []
-if len(sys.argv) == 2:
-	if sys.argv[1] == '--default-path':
-		if myOS == 'Windows':
-			vlc_path = 'C:/Users/' + username + '/AppData/Roaming/vlc/vlc-qt-interface.ini'
-			get_LPP_WinNix(vlc_path, fn)
-		if myOS == 'Linux':
-			vlc_path = '/home/' + username + '/.config/vlc/vlc-qt-interface.conf'
-			get_LPP_WinNix(vlc_path, fn)
-		if myOS == 'Darwin':
-			vlc_path = '/Users/' + username + '/Library/Preferences/org.videolan.vlc.plist'
-			get_LPP_macOS(vlc_path, fn)
-	elif 'vlc-qt-interface' in sys.argv[1]:
-		vlc_path = os.path.abspath(sys.argv[1])
-		get_LPP_WinNix(vlc_path, fn)
-	elif 'org.videolan.vlc.plist' in sys.argv[1]:
-		vlc_path = os.path.abspath(sys.argv[1])
-		get_LPP_macOS(vlc_path, fn)
-	else:
-		get_help()
-else:
-	get_help()
\ No newline at end of file
+if __name__ == '__main__':
+	main(sys.argv)
\ No newline at end of file
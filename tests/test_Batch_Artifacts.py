@@ -0,0 +1,91 @@
+'''
+Tests of Batch_Artifacts.py over a synthetic tree of thousands of Firefox profiles written by
+Synthetic_Artifacts.py. Run from the repository folder with: python -m unittest discover tests
+'''
+
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Batch_Artifacts
+import Firefox_AdblockPlus
+import Synthetic_Artifacts
+
+profiles = 2000
+entries  = 5
+#user folders: ASCII, UTF-8 and Latin-1 (not valid UTF-8) names
+users    = ('user', 'Jos\xc3\xa9', 'Ren\xe9')
+fd_limit = 256 # lower than the number of files: a connection left open by every task exhausts the descriptors
+
+class BatchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp(prefix="test_batch_")
+        templates  = os.path.join(cls.folder, 'templates')
+        os.makedirs(templates)
+        sqlite_fn  = os.path.join(templates, 'storage-sync.sqlite')
+        storage_fn = os.path.join(templates, 'storage.js')
+        Synthetic_Artifacts.write_storage_sync(sqlite_fn, entries)
+        Synthetic_Artifacts.write_storage_js(storage_fn, entries)
+        cls.root = os.path.join(cls.folder, 'Users')
+        for n in range(profiles):
+            profile = os.path.join(cls.root, users[n % len(users)], 'AppData', 'Roaming', 'Mozilla', 'Firefox', 'Profiles', 'p%d.default' % n)
+            extension_dir = os.path.join(profile, 'browser-extension-data', Firefox_AdblockPlus.firefox_id)
+            os.makedirs(extension_dir)
+            shutil.copyfile(sqlite_fn, os.path.join(profile, 'storage-sync.sqlite'))
+            shutil.copyfile(storage_fn, os.path.join(extension_dir, 'storage.js'))
+        for user in users:
+            vlc_dir = os.path.join(cls.root, user, '.config', 'vlc')
+            os.makedirs(vlc_dir)
+            Synthetic_Artifacts.write_vlc_conf(os.path.join(vlc_dir, 'vlc-qt-interface.conf'), entries)
+        shutil.rmtree(templates)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder)
+
+    def setUp(self):
+        self.limits = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(fd_limit, self.limits[0]), self.limits[1]))
+
+    def tearDown(self):
+        resource.setrlimit(resource.RLIMIT_NOFILE, self.limits)
+
+    def test_files(self):
+        files = Batch_Artifacts.get_files([self.root])
+        self.assertEqual(len(files), 2 * profiles + len(users))
+        self.assertEqual(files, sorted(files))
+
+    def test_results(self):
+        files  = Batch_Artifacts.get_files([self.root])
+        errors = []
+        counts = {}
+        for task, path, rows, error in Batch_Artifacts.get_results(files, 2):
+            if error is not None:
+                errors.append((path, error))
+            counts[task[0]] = counts.get(task[0], 0) + len(rows)
+            for row in rows:
+                self.assertTrue(all(isinstance(value, unicode) for value in row))
+                #the path of the source file is kept: encoded back, it names the file on disk
+                self.assertTrue(os.path.exists(row[5].encode('utf-8')) or os.path.exists(row[5].encode('latin-1')))
+        self.assertEqual(errors, [])
+        self.assertEqual(counts, {'NoScript': profiles * entries, 'AdblockPlus': profiles * entries, 'VLC': len(users) * entries})
+
+    def test_batch(self):
+        fn = os.path.join(self.folder, 'batch.csv')
+        Batch_Artifacts.get_batch([self.root], 2, fn)
+        with open(fn, 'rb') as f:
+            lines = f.read().decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 1 + (2 * profiles + len(users)) * entries)
+        self.assertTrue(any(u'Jos\xe9' in line for line in lines))
+        self.assertTrue(any(u'Ren\xe9' in line for line in lines)) # Latin-1 folder name, kept as is
+        os.remove(fn)
+
+if __name__ == '__main__':
+    unittest.main()
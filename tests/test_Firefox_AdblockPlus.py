@@ -0,0 +1,137 @@
+'''
+Tests of the Chrome LevelDB reader of Firefox_AdblockPlus.py, over small LevelDB folders written by
+Synthetic_Artifacts.py. Run from the repository folder with: python -m unittest discover tests
+'''
+
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Firefox_AdblockPlus
+import Synthetic_Artifacts
+
+key = Firefox_AdblockPlus.chrome_keys[0]
+
+def get_block_types(path):
+    #compression type of every data block listed in the index of a .ldb file
+    with open(path, 'rb') as f:
+        data = f.read()
+        footer = data[-48:]
+        metaindex_offset, pos = Firefox_AdblockPlus.get_varint(footer, 0)
+        metaindex_size, pos   = Firefox_AdblockPlus.get_varint(footer, pos)
+        index_offset, pos     = Firefox_AdblockPlus.get_varint(footer, pos)
+        index_size, pos       = Firefox_AdblockPlus.get_varint(footer, pos)
+        types = []
+        for index_key, handle in Firefox_AdblockPlus.get_block_entries(Firefox_AdblockPlus.get_block(f, index_offset, index_size)):
+            offset, pos = Firefox_AdblockPlus.get_varint(handle, 0)
+            size, pos   = Firefox_AdblockPlus.get_varint(handle, pos)
+            types.append(data[offset + size])
+    return types
+
+def get_record_types(path):
+    #type of every record of a .log file
+    types = []
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(Firefox_AdblockPlus.log_block)
+            if not block:
+                return types
+            pos = 0
+            while pos + 7 <= len(block):
+                checksum, length, record_type = struct.unpack('<IHB', block[pos:pos + 7])
+                if record_type == 0:
+                    break
+                types.append(record_type)
+                pos += 7 + length
+
+class LevelDBTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="test_leveldb_")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, name, data):
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def get_websites(self):
+        return sorted(record.website for record in Firefox_AdblockPlus.get_whitelist_chrome(self.folder))
+
+    def test_snappy(self):
+        rnd = random.Random(0)
+        samples = ["", "a", "abcd" * 3, "x" * 1000, "".join(chr(rnd.randint(0, 255)) for n in range(5000)),
+                   ("@@||site%d.com^$document" % rnd.randint(0, 50)) * 400]
+        for data in samples:
+            self.assertEqual(Firefox_AdblockPlus.get_snappy(Synthetic_Artifacts.get_snappy(data)), data)
+
+    def test_uncompressed_and_snappy_blocks(self):
+        for compress, expected in ((False, "\x00"), (True, "\x01")):
+            path = self.write("000005.ldb", Synthetic_Artifacts.get_table(
+                [(key, 7, 1, Synthetic_Artifacts.get_patterns(["a.com", "b.org"], 200))], compress=compress))
+            self.assertEqual(get_block_types(path), [expected])
+            self.assertEqual(self.get_websites(), ["a.com", "b.org"])
+
+    def test_mixed_blocks(self):
+        #a block of random bytes doesn't compress: it is saved uncompressed next to compressed ones
+        rnd     = random.Random(1)
+        noise   = "".join(chr(rnd.randint(0, 255)) for n in range(3000))
+        records = [("file:a", 9, 1, noise), (key, 8, 1, Synthetic_Artifacts.get_patterns(["c.net"], 300)), ("pref:z", 3, 1, noise)]
+        path    = self.write("000005.ldb", Synthetic_Artifacts.get_table(records, block_size=1024))
+        self.assertEqual(sorted(set(get_block_types(path))), ["\x00", "\x01"])
+        self.assertEqual(self.get_websites(), ["c.net"])
+
+    def test_key_in_several_blocks(self):
+        #the versions of the key are in consecutive data blocks: the newest one (highest sequence) wins
+        records = [("file:a", 50, 1, "x" * 600)]
+        records.extend((key, sequence, 1, Synthetic_Artifacts.get_patterns(["v%d.com" % sequence], 20)) for sequence in range(40, 30, -1))
+        records.append(("pref:z", 2, 1, "y" * 600))
+        path   = self.write("000005.ldb", Synthetic_Artifacts.get_table(records, block_size=1024))
+        self.assertTrue(len(get_block_types(path)) > 3)
+        values = list(Firefox_AdblockPlus.get_table_values(path, [key]))
+        self.assertEqual([sequence for value_key, sequence, value_type, value in values], range(40, 30, -1))
+        self.assertEqual(self.get_websites(), ["v40.com"])
+
+    def test_log_fragments(self):
+        #a write batch larger than two 32 KB blocks is split into FIRST, MIDDLE and LAST records
+        sites = ["site%d.example.com" % n for n in range(4000)]
+        path  = self.write("000006.log", Synthetic_Artifacts.get_log([(3, [(1, "pref:x", "1")]), (4, [(1, key, Synthetic_Artifacts.get_patterns(sites))])]))
+        self.assertEqual(get_record_types(path)[0], 1)
+        self.assertEqual(get_record_types(path)[1], 2)
+        self.assertTrue(3 in get_record_types(path))
+        self.assertEqual(get_record_types(path)[-1], 4)
+        self.assertEqual(self.get_websites(), sorted(sites))
+
+    def test_log_overrides_table(self):
+        self.write("000005.ldb", Synthetic_Artifacts.get_table([(key, 5, 1, Synthetic_Artifacts.get_patterns(["old.com"]))]))
+        self.write("000006.log", Synthetic_Artifacts.get_log([(8, [(1, key, Synthetic_Artifacts.get_patterns(["new.com"]))])]))
+        self.assertEqual(self.get_websites(), ["new.com"])
+
+    def test_deleted_key(self):
+        #a deletion with a higher sequence number than the value in the table: no whitelist
+        self.write("000005.ldb", Synthetic_Artifacts.get_table([(key, 5, 1, Synthetic_Artifacts.get_patterns(["old.com"]))]))
+        self.write("000006.log", Synthetic_Artifacts.get_log([(8, [(0, key, None)])]))
+        self.assertEqual(self.get_websites(), [])
+        #a deletion in the table, older than the value of the log
+        os.remove(os.path.join(self.folder, "000006.log"))
+        self.write("000005.ldb", Synthetic_Artifacts.get_table([(key, 9, 0, ""), (key, 5, 1, Synthetic_Artifacts.get_patterns(["old.com"]))]))
+        self.assertEqual(self.get_websites(), [])
+        self.write("000007.log", Synthetic_Artifacts.get_log([(12, [(1, key, Synthetic_Artifacts.get_patterns(["again.com"]))])]))
+        self.assertEqual(self.get_websites(), ["again.com"])
+
+    def test_synthetic_folder(self):
+        for entries in (0, 10, 3000):
+            self.assertEqual(Synthetic_Artifacts.write_leveldb(self.folder, entries), entries)
+            self.assertEqual(len(self.get_websites()), entries)
+
+if __name__ == '__main__':
+    unittest.main()
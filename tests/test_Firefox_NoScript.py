@@ -0,0 +1,406 @@
+'''
+Tests of the HTTP probes of Firefox_NoScript.py against stub HTTP servers started on local ports.
+Run from the repository folder with: python -m unittest discover tests
+'''
+
+import BaseHTTPServer
+import os
+import random
+import re
+import shutil
+import socket
+import sqlite3
+import SocketServer
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Firefox_NoScript
+import Metrics
+import Output_Writers
+import Results_Cache
+import Synthetic_Artifacts
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, so that the reuse of a connection can be seen
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if self.path == '/wait':
+                time.sleep(0.3)
+            if server.mode == 'slow':
+                time.sleep(5)
+            if server.mode == 'redirect' and self.path == '/':
+                self.send_response(302)
+                self.send_header('Location', '/final')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if server.mode == 'page':
+                body = '<html>%s<script src="http://%s/a.js"></script></html>' % ('x' * 2000, server.script_host)
+            else:
+                body = 'small'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, mode, script_host=''):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.mode        = mode
+        self.script_host = script_host
+        self.lock        = threading.Lock()
+        self.connections = 0
+        self.requests    = []
+        self.active      = 0
+        self.max_active  = 0
+        self.site        = '127.0.0.1:%d' % self.server_address[1]
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def handle_error(self, request, client_address):
+        pass # a client that gave up (deadline) closes the connection before the answer is written
+
+def get_dead_site():
+    #a local port nobody listens on
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    site = '127.0.0.1:%d' % sock.getsockname()[1]
+    sock.close()
+    return site
+
+class ProbeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.script   = StubServer('page', 'cdn.invalid') # not a probed site
+        cls.page     = StubServer('page', cls.script.site)
+        cls.redirect = StubServer('redirect')
+        cls.small    = StubServer('small')
+        cls.slow     = StubServer('slow')
+        cls.dead     = get_dead_site()
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in (cls.script, cls.page, cls.redirect, cls.small, cls.slow):
+            server.shutdown()
+            server.server_close()
+
+    def test_redirect_reuses_connection(self):
+        connections = self.redirect.connections
+        res_url, content_length, capture = Firefox_NoScript.get_probe(self.redirect.site, time.time() + 10)
+        self.assertEqual(res_url, 'http://%s/final' % self.redirect.site)
+        self.assertEqual(content_length, 5)
+        self.assertEqual(capture.size, 5)
+        self.assertEqual(self.redirect.requests[-2:], ['/', '/final'])
+        self.assertEqual(self.redirect.connections - connections, 1)
+
+    def test_per_host_limit(self):
+        errors = []
+        def request():
+            conns = {}
+            try:
+                Firefox_NoScript.get_response('http://%s/wait' % self.small.site, {}, time.time() + 10, conns)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                for conn in conns.values():
+                    conn.close()
+        threads = [threading.Thread(target=request) for n in range(3 * Firefox_NoScript.probe_per_host)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.small.requests.count('/wait'), len(threads))
+        self.assertEqual(self.small.max_active, Firefox_NoScript.probe_per_host)
+
+    def test_deadline(self):
+        #the slow site has no answer before the deadline; the other probes are not delayed by it
+        s_time = time.time()
+        probes = Firefox_NoScript.get_probes([self.slow.site, self.small.site], 4, 1)
+        self.assertTrue(time.time() - s_time < 2.5)
+        self.assertEqual(probes[self.slow.site], ('', None, None))
+        self.assertEqual(probes[self.small.site][0], 'http://%s' % self.small.site)
+
+    def test_dead_host(self):
+        s_time = time.time()
+        probes = Firefox_NoScript.get_probes([self.dead], 4, 10)
+        self.assertTrue(time.time() - s_time < 2)
+        self.assertEqual(probes[self.dead], ('', None, None))
+
+    def test_visits_order(self):
+        sites = [(self.page.site, 'trusted'), (self.script.site, 'trusted'), (self.redirect.site, 'untrusted'),
+                 (self.small.site, 'trusted'), (self.dead, 'trusted'), (u'abc.onion', 'trusted')]
+        expected = None
+        for seed in range(3):
+            permissions = [Firefox_NoScript.Permission(site, trust_level, 'storage-sync.sqlite') for site, trust_level in sites]
+            random.Random(seed).shuffle(permissions)
+            visits = Firefox_NoScript.get_visits(permissions, workers=8, deadline=10)
+            if expected is None:
+                expected = visits
+            self.assertEqual(visits, expected)
+        self.assertEqual([visit.site for visit in expected], sorted(site for site, trust_level in sites))
+        visited = dict((visit.site, (visit.visited, visit.http_response, visit.content_length)) for visit in expected)
+        responses = dict((visit.site, visit.response_url) for visit in expected)
+        self.assertEqual(visited[self.page.site][:2], ('possible', 'yes'))
+        self.assertTrue(int(visited[self.page.site][2]) >= 1024)
+        self.assertEqual(visited[self.script.site][0], '') # loaded by the page: not visited directly
+        self.assertEqual(visited[self.redirect.site], ('', 'yes', '5'))
+        self.assertEqual(responses[self.redirect.site], 'http://%s/final' % self.redirect.site)
+        self.assertEqual(visited[self.small.site], ('', 'yes', '5'))
+        self.assertEqual(visited[self.dead], ('', 'no', ''))
+        self.assertEqual(visited[u'abc.onion'][0], 'possible')
+
+    def test_metrics_single_resolution(self):
+        #with --metrics, a host that was not pre-resolved is resolved once (timed as probe.dns) and connected to that address
+        site        = 'localhost:%d' % self.small.server_address[1]
+        resolved    = []
+        getaddrinfo = socket.getaddrinfo
+        def counting_getaddrinfo(host, *args):
+            resolved.append(host)
+            return getaddrinfo(host, *args)
+        metrics = Metrics.enable('test')
+        socket.getaddrinfo = counting_getaddrinfo
+        try:
+            conns = {}
+            res = Firefox_NoScript.get_response('http://%s/' % site, {}, time.time() + 10, conns)
+            for conn in conns.values():
+                conn.close()
+        finally:
+            socket.getaddrinfo = getaddrinfo
+            Metrics.metrics = None
+        self.assertEqual(res.status, 200)
+        self.assertEqual(resolved.count('localhost'), 1)
+        self.assertEqual(metrics.phases['probe.dns'][0], 1)
+        self.assertEqual(metrics.phases['probe.connect'][0], 1)
+
+    def test_cached_probes(self):
+        #the probes are cached as plain tuples (no class of the module is pickled) and answered from the cache next time
+        folder = tempfile.mkdtemp(prefix="test_cache_")
+        try:
+            permissions = [Firefox_NoScript.Permission(self.page.site, 'trusted', 'storage-sync.sqlite')]
+            cache = Results_Cache.ResultsCache(os.path.join(folder, 'probes.cache'))
+            first = Firefox_NoScript.get_visits(permissions, deadline=10, cache=cache)
+            for value, in cache.connect.execute("SELECT value FROM cache WHERE key LIKE 'probe|%'"):
+                self.assertFalse('Capture' in str(value))
+            requests = len(self.page.requests)
+            self.assertEqual(Firefox_NoScript.get_visits(permissions, deadline=10, cache=cache), first)
+            self.assertEqual(len(self.page.requests), requests)
+            cache.close()
+        finally:
+            shutil.rmtree(folder)
+
+class PermissionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="test_permissions_")
+        self.db     = os.path.join(self.folder, 'storage-sync.sqlite')
+        Synthetic_Artifacts.write_storage_sync(self.db, 20)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def get_temp_folders(self):
+        return [name for name in os.listdir(tempfile.gettempdir()) if name.startswith("NoScript_")]
+
+    def test_no_connection_left_open(self):
+        #every call opens and closes its own connection: no descriptor or temporary copy of the evidence is left behind
+        fds     = len(os.listdir('/proc/self/fd'))
+        folders = self.get_temp_folders()
+        for wal in (False, True) * 100:
+            self.assertEqual(len(list(Firefox_NoScript.get_permissions(self.db, wal=wal))), 20)
+        self.assertEqual(len(os.listdir('/proc/self/fd')), fds)
+        self.assertEqual(self.get_temp_folders(), folders)
+
+    def test_one_output_file_per_run(self):
+        #several profiles with -r: the output file is started (and renamed) once, with the rows of every profile
+        profiles = [self.db]
+        for n in range(2):
+            profile = os.path.join(self.folder, 'p%d' % n, 'storage-sync.sqlite')
+            os.makedirs(os.path.dirname(profile))
+            Synthetic_Artifacts.write_storage_sync(profile, 5, seed=n + 1)
+            profiles.append(profile)
+        hosts = os.path.join(self.folder, 'hosts') # no site resolves: nothing is requested
+        open(hosts, 'wb').close()
+        fn     = os.path.join(self.folder, 'visits.csv')
+        starts = []
+        start  = Output_Writers.OutputWriter.start
+        def counting_start(writer, append):
+            starts.append(append)
+            return start(writer, append)
+        Output_Writers.OutputWriter.start = counting_start
+        stdout     = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            Firefox_NoScript.main(['Firefox_NoScript.py'] + profiles + ['-r', '--hosts', hosts, '--output', fn])
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+            Output_Writers.OutputWriter.start = start
+            Firefox_NoScript.probe_addresses.clear()
+        self.assertEqual(starts, [False])
+        with open(fn, 'rb') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 1 + 20 + 5 + 5)
+        self.assertEqual(sorted(set(line.rsplit(',', 1)[1] for line in lines[1:])), sorted(profiles))
+
+    def test_missing_policy(self):
+        connect = sqlite3.connect(self.db)
+        connect.execute("DELETE FROM collection_data WHERE record_id = 'key-policy'")
+        connect.commit()
+        connect.close()
+        self.assertEqual(list(Firefox_NoScript.get_permissions(self.db)), [])
+
+class OptionTest(unittest.TestCase):
+
+    def test_get_option(self):
+        #values below 1 (no worker thread, no time, no body) fall back to the default
+        for value, expected in (('8', 8), ('0', 16), ('-3', 16), ('x', 16)):
+            self.assertEqual(Firefox_NoScript.get_option(['-r', '--workers', value], '--workers', 16), expected)
+        self.assertEqual(Firefox_NoScript.get_option(['-r', '--workers'], '--workers', 16), 16)
+        self.assertEqual(Firefox_NoScript.get_option(['-r'], '--deadline', 300), 300)
+
+    def test_no_workers(self):
+        self.assertEqual(Firefox_NoScript.get_probes([get_dead_site()], 0, 5).values(), [('', None, None)])
+
+class ResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        Firefox_NoScript.probe_addresses.clear()
+
+    def tearDown(self):
+        Firefox_NoScript.probe_addresses.clear()
+
+    def test_deadline(self):
+        #the queries still running at the deadline are abandoned, and no new query is started after it
+        queried = []
+        def slow_resolver(host):
+            queried.append(host)
+            time.sleep(0.5)
+            return ['127.0.0.1']
+        hosts    = ['host%d.example.com' % n for n in range(4 * Firefox_NoScript.dns_workers)]
+        s_time   = time.time()
+        resolved = Firefox_NoScript.get_resolved(hosts, 0.2, resolver=slow_resolver)
+        self.assertTrue(time.time() - s_time < 0.5)
+        self.assertEqual(resolved, {})
+        time.sleep(1.5)
+        self.assertEqual(len(queried), Firefox_NoScript.dns_workers)
+
+    def test_unresolved_sites(self):
+        #a site that doesn't resolve is never requested; its negative answer is kept for the next profiles
+        alive   = StubServer('small')
+        dead    = StubServer('small')
+        queried = []
+        def stub_resolver(host):
+            queried.append(host)
+            return {'alive.test': ['127.0.0.1']}.get(host, [])
+        try:
+            permissions = [Firefox_NoScript.Permission('alive.test:%d' % alive.server_address[1], 'trusted', 'storage-sync.sqlite'),
+                           Firefox_NoScript.Permission('dead.test:%d' % dead.server_address[1], 'trusted', 'storage-sync.sqlite')]
+            for run in range(2):
+                visits = Firefox_NoScript.get_visits(permissions, deadline=10, resolver=stub_resolver)
+                self.assertEqual([(visit.http_response, visit.content_length) for visit in visits], [('yes', '5'), ('no', '')])
+            self.assertEqual(sorted(queried), ['alive.test', 'dead.test']) # the second run asks nothing
+            self.assertEqual(Firefox_NoScript.probe_addresses['dead.test'], [])
+            self.assertEqual(len(alive.requests), 2)
+            self.assertEqual(dead.requests, [])
+            self.assertEqual(dead.connections, 0)
+        finally:
+            for server in (alive, dead):
+                server.shutdown()
+                server.server_close()
+
+    def test_cached_answers(self):
+        #answers of the system resolver are cached for the next runs, negative ones for a shorter time
+        folder        = tempfile.mkdtemp(prefix="test_cache_")
+        get_addresses = Firefox_NoScript.get_addresses
+        Firefox_NoScript.get_addresses = lambda host: {'alive.test': ['127.0.0.1']}.get(host, [])
+        try:
+            cache = Results_Cache.ResultsCache(os.path.join(folder, 'dns.cache'))
+            self.assertEqual(Firefox_NoScript.get_resolved(['alive.test', 'dead.test'], 10, cache),
+                             {'alive.test': ['127.0.0.1'], 'dead.test': []})
+            now = time.time()
+            ttl = dict((key.split('|')[-1], expires - now) for key, expires in cache.connect.execute("SELECT key, expires FROM cache"))
+            self.assertTrue(abs(ttl['alive.test'] - Results_Cache.dns_ttl) < 60)
+            self.assertTrue(abs(ttl['dead.test'] - Results_Cache.dns_negative_ttl) < 60)
+            Firefox_NoScript.probe_addresses.clear()
+            Firefox_NoScript.get_addresses = lambda host: self.fail("%s resolved again" % host)
+            self.assertEqual(Firefox_NoScript.get_resolved(['alive.test', 'dead.test'], 10, cache),
+                             {'alive.test': ['127.0.0.1'], 'dead.test': []})
+            cache.close()
+        finally:
+            Firefox_NoScript.get_addresses = get_addresses
+            shutil.rmtree(folder)
+
+    def test_hosts_resolver(self):
+        folder = tempfile.mkdtemp(prefix="test_hosts_")
+        try:
+            fn = os.path.join(folder, 'hosts')
+            with open(fn, 'wb') as f:
+                f.write("# comment\n127.0.0.1 alive.test Www.Alive.Test. # alias\n\n10.0.0.1 other.test\n10.0.0.2 other.test\n")
+            resolver = Firefox_NoScript.get_hosts_resolver(fn)
+            self.assertEqual(resolver('alive.test'), ['127.0.0.1'])
+            self.assertEqual(resolver('www.alive.test'), ['127.0.0.1'])
+            self.assertEqual(resolver('other.test'), ['10.0.0.1', '10.0.0.2'])
+            self.assertEqual(resolver('missing.test'), [])
+        finally:
+            shutil.rmtree(folder)
+
+class HostnameTest(unittest.TestCase):
+
+    def test_get_hostname(self):
+        for site, host in ((u'\xa7:Google.com.', 'google.com'), (u'https://google.com:443/', 'google.com'),
+                           ('Google.com:8080', 'google.com'), (u' www.example.com ', 'www.example.com'),
+                           (u'http://user@B\xfccher.de:80/x', 'xn--bcher-kva.de'), (u'B\xfccher.de', 'xn--bcher-kva.de'),
+                           (u'127.0.0.1:18001', '127.0.0.1'), (u'http://[::1]/', '::1'), (u'', ''), (u'http://[bad', '')):
+            self.assertEqual(Firefox_NoScript.get_hostname(site), host)
+
+    def test_trusted_index(self):
+        #the default trusted sites and the sites of the policy are compared by the same host name
+        index = Firefox_NoScript.TrustedIndex([u'google.com', u'https://B\xfccher.de/', u'\xa7:paypal.com'])
+        for site in (u'www.google.com', u'https://google.com:443', u'xn--bcher-kva.de', u'shop.b\xfccher.de', u'\xa7:paypal.com.'):
+            self.assertTrue(site in index)
+        for site in (u'google.com.au', u'notgoogle.com', u'example.com'):
+            self.assertFalse(site in index)
+
+class IncludedTest(unittest.TestCase):
+
+    def get_included(self, domains, references):
+        trie = Firefox_NoScript.get_trie(domains)
+        return sorted(Firefox_NoScript.get_included(references, re.compile("(?=(%s))" % Firefox_NoScript.get_trie_regex(trie)), trie))
+
+    def test_prefix_domains(self):
+        #a visited site that is a prefix of another one is found at the same position
+        domains = [u'example.com', u'example.com.au', u'site.co', u'site.com', u'other.net']
+        self.assertEqual(self.get_included(domains, ('http://cdn.example.com.au/a.js',)), ['example.com', 'example.com.au'])
+        self.assertEqual(self.get_included(domains, ('//site.com/x.js',)), ['site.co', 'site.com'])
+        self.assertEqual(self.get_included(domains, ('http://example.com/a.js', 'https://www.other.net/b.js')), ['example.com', 'other.net'])
+        self.assertEqual(self.get_included(domains, ('http://example.org/a.js',)), [])
+
+if __name__ == '__main__':
+    unittest.main()
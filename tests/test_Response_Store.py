@@ -0,0 +1,57 @@
+'''
+Tests of the response archive of Response_Store.py.
+Run from the repository folder with: python -m unittest discover tests
+'''
+
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Response_Store
+
+def get_mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="test_store_")
+        self.path   = os.path.join(self.folder, 'responses.zip')
+        self.umask  = os.umask(022)
+
+    def tearDown(self):
+        os.umask(self.umask)
+        shutil.rmtree(self.folder)
+
+    def record(self, urls):
+        store = Response_Store.ArchiveStore(self.path, record=True)
+        for url in urls:
+            store.put(Response_Store.Response(url, 200, [('Content-Type', 'text/html')], 'body of %s' % url))
+        store.close()
+
+    def get_urls(self):
+        store = Response_Store.ArchiveStore(self.path)
+        urls  = sorted(store.get(url).url for url in ('http://a.com/', 'http://b.com/') if store.get(url) is not None)
+        store.close()
+        return urls
+
+    def test_mode(self):
+        #the archive is readable like a file created by open(), whether it is written directly or merged
+        self.record(['http://a.com/'])
+        self.assertEqual(get_mode(self.path), 0644)
+        os.remove(self.path)
+        self.record(['http://a.com/', 'http://a.com/']) # a copy: merged
+        self.assertEqual(get_mode(self.path), 0644)
+        os.umask(027)
+        self.record(['http://b.com/']) # a previous archive: merged
+        self.assertEqual(get_mode(self.path), 0640)
+        self.assertEqual(self.get_urls(), ['http://a.com/', 'http://b.com/'])
+        self.assertEqual([name for name in os.listdir(self.folder)], ['responses.zip'])
+
+if __name__ == '__main__':
+    unittest.main()
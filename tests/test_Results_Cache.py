@@ -0,0 +1,58 @@
+'''
+Tests of the on-disk results cache of Results_Cache.py.
+Run from the repository folder with: python -m unittest discover tests
+'''
+
+import cPickle
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Results_Cache
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="test_cache_")
+        self.cache  = Results_Cache.ResultsCache(os.path.join(self.folder, 'results.cache'))
+
+    def tearDown(self):
+        self.cache.connect.close()
+        shutil.rmtree(self.folder)
+
+    def put_raw(self, key, value):
+        self.cache.connect.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                                   (key, sqlite3.Binary(value), len(value), time.time() + 60, time.time()))
+
+    def get_keys(self):
+        return [key for key, in self.cache.connect.execute("SELECT key FROM cache ORDER BY key")]
+
+    def test_put_get(self):
+        self.cache.put('a', ('http://a.com', 10, ('x',)), 60)
+        self.cache.put('b', [1, 2], -1) # already expired
+        self.assertEqual(self.cache.get('a'), ('http://a.com', 10, ('x',)))
+        self.assertEqual(self.cache.get('b'), None)
+        self.assertEqual(self.cache.get('c'), None)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_unreadable_entries(self):
+        #a value that can't be unpickled is a miss, and its row is deleted
+        valid = cPickle.dumps(('http://a.com', None, None), cPickle.HIGHEST_PROTOCOL)
+        self.put_raw('truncated', valid[:len(valid) // 2])
+        self.put_raw('foreign', 'not a pickle')
+        self.put_raw('old class', "c__main__\nCapture\np0\n.") # a class of a script that is not loaded
+        self.put_raw('valid', valid)
+        for key in ('truncated', 'foreign', 'old class'):
+            self.assertEqual(self.cache.get(key), None)
+        self.assertEqual(self.cache.get('valid'), ('http://a.com', None, None))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+        self.assertEqual(self.get_keys(), ['valid'])
+
+if __name__ == '__main__':
+    unittest.main()